@@ -4,52 +4,97 @@
 """
 
 import os
-from typing import Optional
-from pydantic import BaseModel, Field
-from dotenv import load_dotenv
+from functools import lru_cache
+from typing import Any, Optional
+from pydantic import AliasChoices, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
-# 加载环境变量
-load_dotenv()
 
+class Settings(BaseSettings):
+    """应用配置
+
+    字段值由pydantic-settings从环境变量和 ``.env`` 文件直接解析，
+    环境变量名默认与字段名一致（不区分大小写）。
+    """
+
+    model_config = SettingsConfigDict(
+        env_file=".env",
+        env_file_encoding="utf-8",
+        extra="ignore",
+        populate_by_name=True,
+    )
 
-class Settings(BaseModel):
-    """应用配置"""
-    
     # 基础配置
     app_name: str = Field(default="LLMCallGateway", description="应用名称")
     app_version: str = Field(default="2.0.0", description="应用版本")
     debug: bool = Field(default=False, description="调试模式")
-    
+
     # 服务器配置
     host: str = Field(default="0.0.0.0", description="服务器主机")
     port: int = Field(default=8728, description="服务器端口")
-    reload: bool = Field(default=False, description="热重载")
-    
+    reload: bool = Field(
+        default=False,
+        validation_alias=AliasChoices("ENABLE_RELOAD"),
+        description="热重载"
+    )
+    workers: int = Field(default=1, description="生产模式下的uvicorn worker进程数（指标和进程内缓存按进程独立统计）")
+
     # LiteLLM配置
-    litellm_api_key: Optional[str] = Field(default=None, description="LiteLLM API密钥")
-    litellm_base_url: Optional[str] = Field(default=None, description="LiteLLM基础URL")
-    
+    litellm_api_key: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("LITELLM_API_KEY", "OPENAI_API_KEY"),
+        description="LiteLLM API密钥"
+    )
+    litellm_base_url: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("LITELLM_BASE_URL", "OPENAI_BASE_URL"),
+        description="LiteLLM基础URL"
+    )
+
     # OpenAI配置（向后兼容）
     openai_api_key: Optional[str] = Field(default=None, description="OpenAI API密钥")
     openai_base_url: Optional[str] = Field(default=None, description="OpenAI基础URL")
-    
+
     # 日志配置
     log_level: str = Field(default="INFO", description="日志级别")
     log_dir: str = Field(default="logs", description="日志目录")
     log_rotation: str = Field(default="10 MB", description="日志轮转大小")
     log_retention: int = Field(default=7, description="日志保留天数")
-    
+    llm_log_level: str = Field(default="INFO", description="LLM交互日志级别")
+    log_queue_size: int = Field(default=10000, description="文件日志队列上限，超出时丢弃最旧记录")
+
     # 中间件配置
     cors_origins: list = Field(default=["*"], description="CORS允许的源")
     enable_cors: bool = Field(default=True, description="启用CORS")
-    
+
     # 性能配置
     request_timeout: int = Field(default=120, description="请求超时时间(秒)")
     max_tokens_limit: int = Field(default=4096, description="最大token限制")
+    http_max_connections: int = Field(default=1000, description="下游HTTP连接池最大连接数")
+    http_max_keepalive_connections: int = Field(default=500, description="下游HTTP连接池最大保活连接数")
+    per_model_concurrency: int = Field(default=100, description="每个模型的最大并发下游请求数（0表示不限制）")
+    queue_timeout: float = Field(default=30.0, description="等待并发名额的最长时间(秒)，超时返回429")
+    enable_inflight_dedup: bool = Field(default=True, description="相同的确定性非流式请求进行中时共用同一次下游调用")
+    enable_request_batching: bool = Field(default=False, description="合并短时间内参数完全相同的非流式请求为一次带n的下游调用")
+    batch_window_ms: int = Field(default=10, description="请求合并窗口(毫秒)")
+    batch_max_size: int = Field(default=8, description="单个合并批次的最大请求数")
+    enable_embedding_batching: bool = Field(default=False, description="合并短时间内同一模型的嵌入请求为一次下游调用")
+    embedding_batch_window_ms: int = Field(default=10, description="嵌入请求合并窗口(毫秒)")
+    embedding_batch_max_inputs: int = Field(default=128, description="单个嵌入合并批次的最大输入条数")
+    metrics_thread_safe: bool = Field(default=False, description="指标收集器使用线程锁（仅在多线程中调用指标接口时需要开启）")
+    embedding_float32_arrays: bool = Field(default=True, description="安装numpy时嵌入向量在网关内以float32数组传递和序列化")
 
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+    # 缓存配置
+    enable_response_cache: bool = Field(default=True, description="启用精确匹配响应缓存（仅temperature为0的非流式请求）")
+    response_cache_size: int = Field(default=10000, description="响应缓存最大条目数")
+    response_cache_ttl: int = Field(default=1800, description="响应缓存过期时间(秒)")
+    response_cache_redis_url: Optional[str] = Field(default=None, description="响应缓存Redis地址（如redis://localhost:6379/0），为空时使用进程内缓存")
+    enable_semantic_cache: bool = Field(default=False, description="启用基于向量相似度的语义缓存")
+    semantic_cache_embedding_model: str = Field(default="text-embedding-3-small", description="语义缓存使用的嵌入模型")
+    semantic_cache_threshold: float = Field(default=0.92, description="语义缓存命中的余弦相似度阈值")
+    semantic_cache_max_temperature: float = Field(default=0.2, description="启用语义缓存的最大temperature")
+    semantic_cache_size: int = Field(default=256, description="语义缓存每个分桶的最大条目数")
+    semantic_cache_max_buckets: int = Field(default=1024, description="语义缓存最大分桶数，超出时淘汰最久未使用的分桶")
 
 
 def get_required_env(key: str) -> str:
@@ -60,36 +105,14 @@ def get_required_env(key: str) -> str:
     return value
 
 
-def load_settings() -> Settings:
-    """加载配置"""
-    return Settings(
-        # 基础配置
-        debug=os.getenv("DEBUG", "false").lower() == "true",
-        
-        # 服务器配置
-        host=os.getenv("HOST", "0.0.0.0"),
-        port=int(os.getenv("PORT", "8728")),
-        reload=os.getenv("ENABLE_RELOAD", "false").lower() == "true",
-        
-        # LiteLLM配置
-        litellm_api_key=os.getenv("LITELLM_API_KEY") or os.getenv("OPENAI_API_KEY"),
-        litellm_base_url=os.getenv("LITELLM_BASE_URL") or os.getenv("OPENAI_BASE_URL"),
-        
-        # OpenAI配置（向后兼容）
-        openai_api_key=os.getenv("OPENAI_API_KEY"),
-        openai_base_url=os.getenv("OPENAI_BASE_URL"),
-        
-        # 日志配置
-        log_level=os.getenv("LOG_LEVEL", "INFO"),
-        log_dir=os.getenv("LOG_DIR", "logs"),
-        log_rotation=os.getenv("LOG_ROTATION", "10 MB"),
-        log_retention=int(os.getenv("LOG_RETENTION", "7")),
-        
-        # 性能配置
-        request_timeout=int(os.getenv("REQUEST_TIMEOUT", "120")),
-        max_tokens_limit=int(os.getenv("MAX_TOKENS_LIMIT", "4096")),
-    )
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """获取全局配置实例（首次访问时解析环境变量和.env文件）"""
+    return Settings()
 
 
-# 全局配置实例
-settings = load_settings()
\ No newline at end of file
+def __getattr__(name: str) -> Any:
+    """延迟创建全局配置实例，兼容 ``from app.core.config import settings``"""
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
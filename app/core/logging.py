@@ -3,13 +3,130 @@
 分离系统日志和LLM交互日志，提供详细的追踪能力
 """
 
+import asyncio
+import atexit
+import copy
+import json
 import os
+import queue
+import re
 import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, List
 from loguru import logger
 
-from .config import settings
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，缺失时回退到标准库json
+    orjson = None
+
+from .config import get_settings
+
+
+def _dumps_log_json(data: Dict[str, Any]) -> str:
+    """将日志数据序列化为单行JSON字符串（NDJSON），优先使用orjson"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # orjson无法处理的类型（如超大整数）回退到标准库
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+try:
+    from loguru._string_parsers import parse_size as _parse_size
+except ImportError:  # loguru内部解析器不可用时按相同规则解析（十进制KB/MB/GB，二进制KiB/MiB/GiB）
+    _SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d*)?)\s*([kmgtpezy]?)(i?)([bB])\s*$", re.IGNORECASE)
+
+    def _parse_size(size: str) -> Optional[float]:
+        match = _SIZE_PATTERN.match(size)
+        if not match:
+            return None
+        number, prefix, binary, unit = match.groups()
+        exponent = "kmgtpezy".find(prefix.lower()) + 1 if prefix else 0
+        value = float(number) * (1024 if binary else 1000) ** exponent
+        return value / 8 if unit == "b" else value
+
+
+class DailySizeRotation:
+    """日志轮转条件：跨天或文件超过指定字节数时轮转"""
+
+    def __init__(self, max_bytes: float):
+        self._max_bytes = max_bytes
+        self._day = datetime.now().date()
+
+    def __call__(self, message, file) -> bool:
+        day = message.record["time"].date()
+        if day != self._day:
+            self._day = day
+            return True
+        # 日志以utf-8写入，按编码后的字节数计算（中文字符占3字节）
+        return file.tell() + len(message.encode("utf-8")) > self._max_bytes
+
+
+def daily_size_rotation(rotation: str) -> Any:
+    """
+    大小类的轮转配置（如"10 MB"，与loguru相同按十进制单位解析）额外在跨天时轮转；
+    其他loguru支持的配置（如"1 week"、"00:00"）原样交给loguru处理
+    """
+    max_bytes = _parse_size(rotation)
+    if max_bytes is None:
+        return rotation
+    return DailySizeRotation(max_bytes)
+
+
+class BoundedQueueWriter:
+    """
+有界队列日志写入器 - 后台线程负责落盘，队列满时丢弃最旧的记录
+避免突发流量下日志队列无限增长
+"""
+
+    def __init__(self, target: "logger", maxsize: int = 10000):
+        self._target = target
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._worker, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def write(self, message: str) -> None:
+        """写入一条已格式化的日志（非阻塞）"""
+        text = str(message)
+        try:
+            self._queue.put_nowait(text)
+        except queue.Full:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped += 1
+            try:
+                self._queue.put_nowait(text)
+            except queue.Full:
+                pass
+
+    def _worker(self) -> None:
+        """后台写入线程"""
+        while True:
+            text = self._queue.get()
+            if text is None:
+                break
+            self._target.opt(raw=True).log("INFO", text)
+
+    def stop(self) -> None:
+        """停止后台线程，写完队列中剩余的日志"""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=1)
+        except queue.Full:
+            return
+        self._thread.join(timeout=5)
 
 
 class LoggerManager:
@@ -23,6 +140,8 @@ class LoggerManager:
         """配置loguru日志系统"""
         if self.initialized:
             return
+
+        settings = get_settings()
             
         # 创建日志目录
         if not os.path.exists(settings.log_dir):
@@ -30,6 +149,8 @@ class LoggerManager:
         
         # 移除默认处理器
         logger.remove()
+        # 文件写入使用独立的logger副本，主logger只负责格式化并放入有界队列
+        self._file_logger_template = copy.deepcopy(logger)
         
         # 基础日志格式
         base_format = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {name} | {message}"
@@ -43,46 +164,55 @@ class LoggerManager:
         )
         
         # 系统主日志文件
-        today = datetime.now().strftime('%Y-%m-%d')
-        main_log_file = os.path.join(settings.log_dir, f'llmcallgateway_system_{today}.log')
-        logger.add(
+        # 文件名中的日期由loguru在创建/轮转文件时计算
+        main_log_file = os.path.join(settings.log_dir, 'llmcallgateway_system_{time:YYYY-MM-DD}.log')
+        self._add_queued_file_sink(
             main_log_file,
             format=base_format,
             level="INFO",
-            rotation=settings.log_rotation,
+            rotation=daily_size_rotation(settings.log_rotation),
             retention=f"{settings.log_retention} days",
             encoding="utf-8",
-            enqueue=True,
         )
         
         # 错误日志文件
-        error_log_file = os.path.join(settings.log_dir, f'llmcallgateway_error_{today}.log')
-        logger.add(
+        error_log_file = os.path.join(settings.log_dir, 'llmcallgateway_error_{time:YYYY-MM-DD}.log')
+        self._add_queued_file_sink(
             error_log_file,
             format=base_format,
             level="ERROR",
-            rotation="5 MB",
+            rotation=daily_size_rotation("5 MB"),
             retention=f"{settings.log_retention} days",
             encoding="utf-8",
-            enqueue=True,
         )
         
         # LLM交互专用日志文件
-        llm_log_file = os.path.join(settings.log_dir, f'llmcallgateway_llm_interactions_{today}.log')
-        logger.add(
+        llm_log_file = os.path.join(settings.log_dir, 'llmcallgateway_llm_interactions_{time:YYYY-MM-DD}.log')
+        self._add_queued_file_sink(
             llm_log_file,
             format="{time:YYYY-MM-DD HH:mm:ss.SSS} | LLM | {message}",
-            level="INFO",
-            rotation="20 MB",
+            level=settings.llm_log_level.upper(),
+            rotation=daily_size_rotation("20 MB"),
             retention=f"{settings.log_retention} days",
             encoding="utf-8",
-            enqueue=True,
             filter=lambda record: record["extra"].get("log_type") == "llm_interaction"
         )
         
         self.initialized = True
         logger.info(f"日志系统初始化完成 - 日志目录: {settings.log_dir}")
     
+    def _add_queued_file_sink(self, path: str, format: str, level: str,
+                              filter=None, **file_options: Any) -> None:
+        """添加经有界队列异步写入的文件处理器"""
+        file_logger = copy.deepcopy(self._file_logger_template)
+        file_logger.add(path, format="{message}", level=0, **file_options)
+        logger.add(
+            BoundedQueueWriter(file_logger, maxsize=get_settings().log_queue_size),
+            format=format,
+            level=level,
+            filter=filter,
+        )
+    
     def get_system_logger(self) -> "logger":
         """获取系统日志记录器"""
         return logger.bind(log_type="system")
@@ -92,74 +222,204 @@ class LoggerManager:
         return logger.bind(log_type="llm_interaction")
 
 
+# Python 3.10+ 才支持 dataclass(slots=True)
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_DATACLASS_SLOTS)
+class Interaction:
+    """进行中的单次下游交互记录"""
+    timestamp: str
+    request_id: str
+    provider: str
+    request_data: Dict[str, Any]
+    response: Any = None
+    processing_time: Optional[float] = None
+    status: str = "pending"
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为日志输出格式（不递归复制请求/响应数据）"""
+        return {
+            "timestamp": self.timestamp,
+            "request_id": self.request_id,
+            "downstream_request": {
+                "provider": self.provider,
+                **self.request_data
+            },
+            "downstream_response": self.response,
+            "processing_time": self.processing_time,
+            "status": self.status,
+            "error": self.error
+        }
+
+
+# LLM交互日志批量写入参数
+LLM_LOG_BATCH_SIZE = 256
+LLM_LOG_FLUSH_INTERVAL = 0.1  # 秒
+# 进行中交互记录上限（如流式响应未被消费时不会完成），超出时淘汰最早的记录
+MAX_PENDING_INTERACTIONS = 10000
+
+
 class LLMInteractionLogger:
     """
 LLM交互专用日志记录器 - 专注于下游服务商的请求/响应跟踪
-输出美观的结构化JSON日志
+每条交互输出为一行JSON（NDJSON），便于grep/jq等工具处理
 """
     
     def __init__(self):
         self.llm_logger = logger.bind(log_type="llm_interaction")
-        self.interactions = {}  # 存储请求信息用于最终输出
+        self.interactions: "OrderedDict[str, Interaction]" = OrderedDict()  # 存储请求信息用于最终输出
+        self._min_level_no = logger.level(get_settings().llm_log_level.upper()).no
+        # 待写出的交互记录，由后台任务批量格式化并写出；队列满时丢弃新记录
+        self._queue: "asyncio.Queue[Interaction]" = asyncio.Queue(maxsize=get_settings().log_queue_size)
+        self._flush_task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    def is_enabled(self, level: str = "INFO") -> bool:
+        """判断指定级别的LLM交互日志是否会被输出"""
+        return logger.level(level).no >= self._min_level_no
     
     def start_interaction(self, request_id: str, provider: str, request_data: Dict[str, Any]) -> None:
-        """开始一个交互记录"""
-        from datetime import datetime
-        
-        self.interactions[request_id] = {
-            "timestamp": datetime.now().isoformat(),
-            "request_id": request_id,
-            "downstream_request": {
-                "provider": provider,
-                **request_data
-            },
-            "downstream_response": None,
-            "processing_time": None,
-            "status": "pending",
-            "error": None
-        }
+        """开始一个交互记录（交互日志被级别过滤时不记录）"""
+        if not self.is_enabled("INFO"):
+            return
+        if len(self.interactions) >= MAX_PENDING_INTERACTIONS:
+            self.interactions.popitem(last=False)
+        self.interactions[request_id] = Interaction(
+            timestamp=datetime.now().isoformat(),
+            request_id=request_id,
+            provider=provider,
+            request_data=request_data
+        )
+
+    @staticmethod
+    def _truncate_embedding(embedding: Any) -> Any:
+        """截断单个embedding值：base64保留前10个字符，浮点列表/数组保留前3个元素"""
+        if isinstance(embedding, str) and len(embedding) > 10:
+            return embedding[:10] + "..."
+        if isinstance(embedding, list) and len(embedding) > 3:
+            return embedding[:3] + ["..."]
+        if hasattr(embedding, "tolist"):  # float32数组
+            return embedding[:3].tolist() + (["..."] if len(embedding) > 3 else [])
+        return embedding
 
     def _truncate_embedding_fields(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        """截断embedding字段值，保留前10个字符以减少日志体积"""
-        import copy
-
-        truncated_data = copy.deepcopy(data)
-
-        # 处理embeddings响应格式
-        if isinstance(truncated_data, dict) and "data" in truncated_data:
-            data_list = truncated_data["data"]
-            if isinstance(data_list, list):
-                for item in data_list:
-                    if isinstance(item, dict) and "embedding" in item:
-                        embedding = item["embedding"]
-                        if isinstance(embedding, str) and len(embedding) > 10:
-                            # 截断base64格式的embedding
-                            item["embedding"] = embedding[:10] + "..."
-                        elif isinstance(embedding, list) and len(embedding) > 3:
-                            # 截断float数组格式的embedding，只保留前3个元素
-                            item["embedding"] = embedding[:3] + ["..."]
-
-        return truncated_data
-
-    def complete_interaction(self, request_id: str, response_data: Dict[str, Any], processing_time: float, success: bool = True, error: str = None) -> None:
-        """完成一个交互记录并输出JSON"""
+        """截断embedding字段值，保留前10个字符以减少日志体积
+
+        只做浅拷贝，不会遍历或复制完整的向量，也不会修改原始数据。
+        """
+        if not isinstance(data, dict) or not isinstance(data.get("data"), list):
+            return data
+
+        truncated_items = []
+        for item in data["data"]:
+            if isinstance(item, dict) and "embedding" in item:
+                item = {**item, "embedding": self._truncate_embedding(item["embedding"])}
+            truncated_items.append(item)
+
+        return {**data, "data": truncated_items}
+
+    def _dump_response(self, response: Any) -> Dict[str, Any]:
+        """将响应模型转换为日志dict，嵌入向量不随model_dump完整复制，只保留截断后的预览"""
+        items = getattr(response, "data", None)
+        if not isinstance(items, list) or not items or not hasattr(items[0], "embedding"):
+            return response.model_dump(exclude_none=True)
+        dumped = response.model_dump(exclude_none=True, exclude={"data": {"__all__": {"embedding"}}})
+        for dumped_item, item in zip(dumped["data"], items):
+            dumped_item["embedding"] = self._truncate_embedding(item.embedding)
+        return dumped
+
+    def complete_interaction(self, request_id: str, response_data: Any, processing_time: float, success: bool = True, error: str = None) -> None:
+        """完成一个交互记录并输出JSON
+
+        ``response_data`` 可以是dict或pydantic模型，模型在实际输出日志时才转换为dict。
+        """
         if request_id not in self.interactions:
             return
             
-        interaction = self.interactions[request_id]
-        interaction["downstream_response"] = self._truncate_embedding_fields(response_data)
-        interaction["processing_time"] = processing_time
-        interaction["status"] = "success" if success else "error"
+        interaction = self.interactions.pop(request_id)
+        # 日志级别过滤掉时跳过截断和序列化
+        if not self.is_enabled("INFO"):
+            return
+
+        interaction.response = response_data
+        interaction.processing_time = processing_time
+        interaction.status = "success" if success else "error"
         if error:
-            interaction["error"] = error
-        
-        # 输出美观的JSON日志
-        import json
-        json_log = json.dumps(interaction, ensure_ascii=False, indent=2)
-        self.llm_logger.info(json_log)
+            interaction.error = error
         
-        # 清理已完成的交互
-        del self.interactions[request_id]
+        # 输出单行JSON日志（截断和序列化推迟到确认有处理器接收时再执行）
+        self._emit(interaction)
+
+    def _format_interaction(self, interaction: Interaction) -> str:
+        """截断embedding字段并序列化交互记录"""
+        data = interaction.to_dict()
+        response = interaction.response
+        if hasattr(response, "model_dump"):
+            data["downstream_response"] = self._dump_response(response)
+        else:
+            data["downstream_response"] = self._truncate_embedding_fields(response)
+        return _dumps_log_json(data)
+
+    def _emit(self, interaction: Interaction) -> None:
+        """写入一条交互日志，后台刷新任务运行时只入队，不在请求路径上格式化"""
+        if self._flush_task is None:
+            self.llm_logger.opt(lazy=True).info("{}", lambda: self._format_interaction(interaction))
+            return
+        try:
+            self._queue.put_nowait(interaction)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def _drain(self, limit: Optional[int] = None) -> List[Interaction]:
+        """取出队列中已有的交互记录"""
+        batch: List[Interaction] = []
+        while limit is None or len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    def _write_batch(self, batch: List[Interaction]) -> None:
+        """逐条写出一批交互日志（每条交互一条记录，保持每行带时间前缀的日志格式）"""
+        info = self.llm_logger.info
+        for interaction in batch:
+            info("{}", self._format_interaction(interaction))
+
+    def flush(self) -> None:
+        """同步写出队列中剩余的交互日志"""
+        self._write_batch(self._drain())
+
+    async def _flush_periodically(self) -> None:
+        """后台任务：等待新记录，攒批后在线程池中格式化并写出，避免占用事件循环"""
+        while True:
+            first = await self._queue.get()
+            try:
+                await asyncio.sleep(LLM_LOG_FLUSH_INTERVAL)
+            except asyncio.CancelledError:
+                # 停止时已取出的记录不能丢失
+                self._write_batch([first] + self._drain())
+                raise
+            batch = [first] + self._drain(LLM_LOG_BATCH_SIZE - 1)
+            await asyncio.to_thread(self._write_batch, batch)
+
+    def start_background_flush(self) -> None:
+        """启动后台批量刷新任务（需在事件循环中调用）"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def stop_background_flush(self) -> None:
+        """停止后台批量刷新任务并写出剩余日志"""
+        task, self._flush_task = self._flush_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.flush()
     
     def log_error_interaction(self, request_id: str, error: Exception, context: str = "") -> None:
         """记录错误交互"""
@@ -171,11 +431,8 @@ LLM交互专用日志记录器 - 专注于下游服务商的请求/响应跟踪
                 success=False, 
                 error=str(error)
             )
-        else:
+        elif self.is_enabled("ERROR"):
             # 如果没有开始记录，直接记录错误
-            from datetime import datetime
-            import json
-            
             error_log = {
                 "timestamp": datetime.now().isoformat(),
                 "request_id": request_id,
@@ -184,16 +441,32 @@ LLM交互专用日志记录器 - 专注于下游服务商的请求/响应跟踪
                 "context": context
             }
             
-            json_log = json.dumps(error_log, ensure_ascii=False, indent=2)
-            self.llm_logger.error(json_log)
+            self.llm_logger.opt(lazy=True).error("{}", lambda: _dumps_log_json(error_log))
+
+
+@lru_cache(maxsize=1)
+def get_log_manager() -> LoggerManager:
+    """获取全局日志管理器（首次访问时才创建日志处理器）"""
+    return LoggerManager()
+
+
+@lru_cache(maxsize=1)
+def get_llm_interaction_logger() -> LLMInteractionLogger:
+    """获取全局LLM交互日志记录器"""
+    get_log_manager()
+    return LLMInteractionLogger()
 
 
-# 全局日志管理器实例
-log_manager = LoggerManager()
+def __getattr__(name: str) -> Any:
+    """延迟创建全局日志实例，兼容原有的模块级导入方式"""
+    if name == "log_manager":
+        return get_log_manager()
+    if name == "system_logger":
+        return get_log_manager().get_system_logger()
+    if name == "llm_interaction_logger":
+        return get_llm_interaction_logger()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# 导出日志记录器
-system_logger = log_manager.get_system_logger()
-llm_interaction_logger = LLMInteractionLogger()
 
 # 为了兼容性，导出logger
 __all__ = ["system_logger", "llm_interaction_logger", "logger"]
\ No newline at end of file
@@ -4,8 +4,10 @@ API数据模型定义
 """
 
 from typing import List, Dict, Any, Optional, Union
-from pydantic import BaseModel, Field
-import time
+from typing_extensions import Annotated
+from pydantic import BaseModel, Field, SerializeAsAny, TypeAdapter
+
+from ..utils.clock import now_seconds
 
 
 class ToolCallFunction(BaseModel):
@@ -57,8 +59,8 @@ class ChatMessage(BaseModel):
 
 class ChatCompletionRequest(BaseModel):
     """聊天补全请求模型"""
-    model: str = Field(..., description="模型名称")
-    messages: List[ChatMessage] = Field(..., description="对话消息列表")
+    model: str = Field(..., description="模型名称", min_length=1)
+    messages: List[ChatMessage] = Field(..., description="对话消息列表", min_length=1)
     
     # 可选参数
     stream: Optional[bool] = Field(False, description="是否流式响应")
@@ -96,6 +98,12 @@ class ChatCompletionRequest(BaseModel):
         description="旧版函数调用策略，将自动映射到tool_choice。"
     )
 
+    # 网关扩展参数
+    prompt_cache: Optional[bool] = Field(
+        True,
+        description="是否为稳定的system提示启用提供商侧提示缓存（Claude的cache_control / OpenAI的prompt_cache_key），设为false可关闭。"
+    )
+
 
 class Usage(BaseModel):
     """Token使用统计模型"""
@@ -115,7 +123,7 @@ class ChatCompletionResponse(BaseModel):
     """聊天补全响应模型"""
     id: str = Field(..., description="请求ID")
     object: str = Field("chat.completion", description="对象类型")
-    created: int = Field(default_factory=lambda: int(time.time()), description="创建时间戳")
+    created: int = Field(default_factory=now_seconds, description="创建时间戳")
     model: str = Field(..., description="使用的模型")
     choices: List[ChatCompletionChoice] = Field(..., description="回复选择列表")
     usage: Optional[Usage] = Field(None, description="Token使用统计")
@@ -143,7 +151,7 @@ class ChatCompletionChunk(BaseModel):
     """流式响应块模型"""
     id: str = Field(..., description="请求ID")
     object: str = Field("chat.completion.chunk", description="对象类型")
-    created: int = Field(default_factory=lambda: int(time.time()), description="创建时间戳")
+    created: int = Field(default_factory=now_seconds, description="创建时间戳")
     model: str = Field(..., description="使用的模型")
     choices: List[ChatCompletionChunkChoice] = Field(..., description="增量选择列表")
 
@@ -152,7 +160,7 @@ class Model(BaseModel):
     """模型信息模型"""
     id: str = Field(..., description="模型ID")
     object: str = Field("model", description="对象类型")
-    created: int = Field(default_factory=lambda: int(time.time()), description="创建时间戳")
+    created: int = Field(default_factory=now_seconds, description="创建时间戳")
     owned_by: str = Field("llmcallgateway", description="模型所有者")
 
 
@@ -173,7 +181,7 @@ class HealthResponse(BaseModel):
     status: str = Field("running", description="服务状态")
     version: str = Field("2.0.0", description="服务版本")
     description: str = Field("LLM API代理服务", description="服务描述")
-    timestamp: int = Field(default_factory=lambda: int(time.time()), description="时间戳")
+    timestamp: int = Field(default_factory=now_seconds, description="时间戳")
 
 
 class MetricsResponse(BaseModel):
@@ -201,7 +209,7 @@ class EmbeddingRequest(BaseModel):
     - ❌ 不要发送tokenized数组: {"input": [3134, 419, 57086], ...}
     - ❌ 不要发送嵌套数组: {"input": [[3134, 419]], ...}
     """
-    input: Union[str, List[str]] = Field(
+    input: Annotated[Union[str, List[str]], Field(union_mode="left_to_right")] = Field(
         ...,
         description="要嵌入的原始文本或文本列表。必须是字符串格式，不接受tokenized数字数组。",
         examples=[
@@ -209,7 +217,7 @@ class EmbeddingRequest(BaseModel):
             ["Hello", "World", "How are you?"]
         ]
     )
-    model: str = Field(..., description="嵌入模型名称，如: text-embedding-3-small")
+    model: str = Field(..., description="嵌入模型名称，如: text-embedding-3-small", min_length=1)
     encoding_format: Optional[str] = Field("float", description="编码格式: 'float'返回浮点数组，'base64'返回base64编码字符串")
     dimensions: Optional[int] = Field(None, description="嵌入向量维度", gt=0)
     user: Optional[str] = Field(None, description="用户标识")
@@ -224,14 +232,33 @@ class EmbeddingData(BaseModel):
     - encoding_format='base64': 返回str base64编码字符串
     """
     object: str = Field("embedding", description="对象类型")
-    embedding: Union[List[float], str] = Field(..., description="嵌入向量(float数组或base64字符串)")
+    # 先尝试str：对浮点数组只做一次类型判断即可跳过，避免逐元素扫描后再回退
+    embedding: Annotated[Union[str, List[float]], Field(union_mode="left_to_right")] = Field(
+        ..., description="嵌入向量(float数组或base64字符串)"
+    )
     index: int = Field(..., description="在输入列表中的索引")
 
 
+class EmbeddingFloatData(EmbeddingData):
+    """float格式的嵌入数据，构建时直接按List[float]校验"""
+    embedding: List[float] = Field(..., description="嵌入向量(float数组)")
+
+
+class EmbeddingBase64Data(EmbeddingData):
+    """base64格式的嵌入数据，构建时直接按str校验"""
+    embedding: str = Field(..., description="嵌入向量(base64字符串)")
+
+
+class EmbeddingArrayData(EmbeddingData):
+    """float32数组格式的嵌入数据（numpy.ndarray），仅由网关内部直接构建，序列化时由orjson输出为浮点数组"""
+    embedding: Any = Field(..., description="嵌入向量(float32数组)")
+
+
 class EmbeddingResponse(BaseModel):
     """Embeddings响应模型"""
     object: str = Field("list", description="对象类型")
-    data: List[EmbeddingData] = Field(..., description="嵌入数据列表")
+    # 按实际子类序列化，float32数组（EmbeddingArrayData）不按父类的字段类型检查
+    data: List[SerializeAsAny[EmbeddingData]] = Field(..., description="嵌入数据列表")
     model: str = Field(..., description="使用的模型")
     usage: Usage = Field(..., description="Token使用统计")
 
@@ -248,3 +275,11 @@ class RequestContext(BaseModel):
 
     class Config:
         arbitrary_types_allowed = True
+
+
+# 导入时完成模型构建，避免首个请求承担校验器编译开销
+ChatCompletionRequest.model_rebuild()
+EmbeddingRequest.model_rebuild()
+
+# 请求体直接解析用的TypeAdapter
+CHAT_COMPLETION_REQUEST_ADAPTER = TypeAdapter(ChatCompletionRequest)
@@ -0,0 +1,252 @@
+"""
+请求合并服务
+在很短的时间窗口内把相同模型、相同参数的非流式请求合并为一次带 ``n`` 的下游调用，
+再把返回的多个choices分发给各个等待的请求；嵌入请求则把多个请求的input拼接为一次调用
+"""
+
+import asyncio
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from ..core.config import settings
+from .cache import ResponseCache
+
+DownstreamCall = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+def _split_tokens(total: int, count: int) -> List[int]:
+    """将token数平均分给count个请求，余数计入最后一个，保证各份之和等于总数"""
+    share, remainder = divmod(total, count)
+    shares = [share] * count
+    shares[-1] += remainder
+    return shares
+
+
+class _PendingBatch:
+    """同一合并键下等待发送的请求"""
+
+    __slots__ = ("request", "futures", "timer")
+
+    def __init__(self, request: Dict[str, Any]):
+        self.request = request
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class BatchCoalescer:
+    """按 (模型, 消息, 采样参数) 合并并发的相同请求"""
+
+    def __init__(self, window: float = 0.01, max_batch: int = 8):
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[str, _PendingBatch] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def applicable(llm_request: Dict[str, Any]) -> bool:
+        """仅合并非流式、单个choice的请求"""
+        return not llm_request.get("stream") and (llm_request.get("n") or 1) == 1
+
+    async def submit(self, llm_request: Dict[str, Any], call: DownstreamCall) -> Any:
+        """加入合并窗口，等待属于本请求的下游响应"""
+        key = ResponseCache.make_key({k: v for k, v in llm_request.items() if k != "n"})
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _PendingBatch(llm_request)
+            batch.timer = loop.call_later(self.window, self._dispatch, key, batch, call)
+        batch.futures.append(future)
+        if len(batch.futures) >= self.max_batch:
+            batch.timer.cancel()
+            self._dispatch(key, batch, call)
+
+        return await future
+
+    def _dispatch(self, key: str, batch: _PendingBatch, call: DownstreamCall) -> None:
+        """关闭合并窗口并发送批次"""
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        task = asyncio.ensure_future(self._run(batch, call))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _PendingBatch, call: DownstreamCall) -> None:
+        futures = batch.futures
+        try:
+            if len(futures) == 1:
+                results = [await call(batch.request)]
+            else:
+                response = await call({**batch.request, "n": len(futures)})
+                results = self._split_choices(response, len(futures))
+                # 下游不支持n（参数被丢弃）时，剩余请求单独调用
+                missing = len(futures) - len(results)
+                if missing:
+                    results.extend(
+                        await asyncio.gather(*(call(batch.request) for _ in range(missing)))
+                    )
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _split_choices(response: Any, count: int) -> List[Any]:
+        """
+        将一次 ``n`` 次采样的响应拆分为多个单choice响应
+        输入只被下游处理一次，输入和输出token都在各请求间平均分摊，避免合计时重复计数
+        """
+        choices = list(response.choices)[:count]
+        if not choices:
+            return []
+        usage = getattr(response, "usage", None)
+        usages: List[Optional[SimpleNamespace]] = [None] * len(choices)
+        if usage:
+            usages = [
+                SimpleNamespace(
+                    prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens,
+                    total_tokens=prompt_tokens + completion_tokens
+                )
+                for prompt_tokens, completion_tokens in zip(
+                    _split_tokens(usage.prompt_tokens or 0, len(choices)),
+                    _split_tokens(usage.completion_tokens or 0, len(choices))
+                )
+            ]
+
+        results = []
+        for choice, split_usage in zip(choices, usages):
+            choice.index = 0
+            results.append(SimpleNamespace(
+                id=response.id,
+                model=response.model,
+                choices=[choice],
+                usage=split_usage
+            ))
+        return results
+
+
+class _PendingEmbeddingBatch:
+    """同一合并键下等待发送的嵌入请求，entries记录每个请求在拼接input中的位置"""
+
+    __slots__ = ("request", "inputs", "entries", "timer")
+
+    def __init__(self, request: Dict[str, Any]):
+        self.request = request
+        self.inputs: List[str] = []
+        self.entries: List[Tuple[int, int, asyncio.Future]] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class EmbeddingBatcher:
+    """按 (模型, 维度, 编码格式) 合并并发的嵌入请求为一次下游调用，再按位置拆分结果"""
+
+    def __init__(self, window: float = 0.01, max_inputs: int = 128):
+        self.window = window
+        self.max_inputs = max_inputs
+        self._pending: Dict[Tuple[Any, ...], _PendingEmbeddingBatch] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def applicable(llm_request: Dict[str, Any]) -> bool:
+        """带user标识的请求不合并，避免不同用户的输入出现在同一次下游调用中"""
+        return not llm_request.get("user")
+
+    async def submit(self, llm_request: Dict[str, Any], call: DownstreamCall) -> Any:
+        """加入合并窗口，等待只包含本请求输入的嵌入响应"""
+        raw_input = llm_request["input"]
+        inputs = [raw_input] if isinstance(raw_input, str) else list(raw_input)
+        key = (llm_request["model"], llm_request.get("dimensions"), llm_request.get("encoding_format"))
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        batch = self._pending.get(key)
+        if batch is not None and len(batch.inputs) + len(inputs) > self.max_inputs:
+            # 放不下时先发送已有批次
+            batch.timer.cancel()
+            self._dispatch(key, batch, call)
+            batch = None
+        if batch is None:
+            batch = self._pending[key] = _PendingEmbeddingBatch(llm_request)
+            batch.timer = loop.call_later(self.window, self._dispatch, key, batch, call)
+        batch.entries.append((len(batch.inputs), len(inputs), future))
+        batch.inputs.extend(inputs)
+        if len(batch.inputs) >= self.max_inputs:
+            batch.timer.cancel()
+            self._dispatch(key, batch, call)
+
+        return await future
+
+    def _dispatch(self, key: Tuple[Any, ...], batch: _PendingEmbeddingBatch, call: DownstreamCall) -> None:
+        """关闭合并窗口并发送批次"""
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        task = asyncio.ensure_future(self._run(batch, call))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _PendingEmbeddingBatch, call: DownstreamCall) -> None:
+        entries = batch.entries
+        try:
+            if len(entries) == 1:
+                results = [await call(batch.request)]
+            else:
+                response = await call({**batch.request, "input": batch.inputs})
+                results = self._split_data(response, entries, len(batch.inputs))
+        except Exception as e:
+            for _, _, future in entries:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(entries, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    def _split_data(response: Any, entries: List[Tuple[int, int, asyncio.Future]], total: int) -> List[Any]:
+        """按请求在拼接input中的位置拆分嵌入结果，输入token按输入条数分摊（余数计入最后一个请求）"""
+        data = sorted(response.data, key=lambda item: item["index"])
+        if len(data) != total:
+            raise ValueError(f"嵌入结果数量({len(data)})与合并后的输入数量({total})不一致")
+        usage = getattr(response, "usage", None)
+        shares: List[int] = []
+        if usage:
+            prompt_total = usage.prompt_tokens or 0
+            shares = [prompt_total * count // total for _, count, _ in entries]
+            shares[-1] += prompt_total - sum(shares)
+
+        results = []
+        for position, (offset, count, _) in enumerate(entries):
+            split_usage = None
+            if usage:
+                prompt_tokens = shares[position]
+                split_usage = SimpleNamespace(prompt_tokens=prompt_tokens, total_tokens=prompt_tokens)
+            results.append(SimpleNamespace(
+                model=response.model,
+                data=[
+                    {**item, "index": item["index"] - offset}
+                    for item in data[offset:offset + count]
+                ],
+                usage=split_usage
+            ))
+        return results
+
+
+# 全局请求合并实例
+batch_coalescer = BatchCoalescer(
+    window=settings.batch_window_ms / 1000,
+    max_batch=settings.batch_max_size
+)
+
+# 全局嵌入请求合并实例
+embedding_batcher = EmbeddingBatcher(
+    window=settings.embedding_batch_window_ms / 1000,
+    max_inputs=settings.embedding_batch_max_inputs
+)
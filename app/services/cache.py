@@ -0,0 +1,267 @@
+"""
+响应缓存服务
+对完全相同的下游请求复用已有响应，减少重复的LLM调用
+"""
+
+import hashlib
+import json
+import math
+import operator
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+
+from ..core.config import settings
+from ..core.logging import system_logger
+from ..models.api_models import ChatCompletionResponse
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，缺失时用纯Python计算相似度
+    np = None
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # redis为可选依赖，仅在配置RESPONSE_CACHE_REDIS_URL时需要
+    redis_asyncio = None
+
+
+class ResponseCache:
+    """进程内精确匹配响应缓存（LRU淘汰 + TTL过期）"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 1800.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(payload: Dict[str, Any]) -> str:
+        """根据请求参数生成缓存键"""
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，过期或不存在时返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """异步读取接口（与Redis后端一致）"""
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any) -> None:
+        """异步写入接口（与Redis后端一致）"""
+        self.set(key, value)
+
+    async def aclose(self) -> None:
+        """内存缓存无需释放资源"""
+
+
+class RedisResponseCache:
+    """
+基于Redis的精确匹配响应缓存 - 多个worker进程共享缓存
+响应以JSON形式存储，由Redis负责TTL过期；Redis异常时按未命中处理，不影响正常请求
+"""
+
+    def __init__(self, url: str, ttl: float = 1800.0, prefix: str = "llmcallgateway:response:"):
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis_asyncio.from_url(url)
+        self.hits = 0
+        self.misses = 0
+
+    make_key = staticmethod(ResponseCache.make_key)
+
+    async def aget(self, key: str) -> Optional[ChatCompletionResponse]:
+        """读取缓存响应，无法解析的值（损坏或旧版本结构）按未命中处理并删除"""
+        try:
+            raw = await self._client.get(self.prefix + key)
+            if raw is not None:
+                value = ChatCompletionResponse.model_validate_json(raw)
+                self.hits += 1
+                return value
+        except ValidationError as e:
+            system_logger.warning(f"Redis响应缓存值无法解析，已删除: {e}")
+            await self._delete(key)
+        except Exception as e:
+            system_logger.warning(f"Redis响应缓存读取失败: {e}")
+        self.misses += 1
+        return None
+
+    async def _delete(self, key: str) -> None:
+        """删除缓存条目，失败时忽略"""
+        try:
+            await self._client.delete(self.prefix + key)
+        except Exception as e:
+            system_logger.warning(f"Redis响应缓存删除失败: {e}")
+
+    async def aset(self, key: str, value: ChatCompletionResponse) -> None:
+        """写入缓存响应"""
+        try:
+            await self._client.set(self.prefix + key, value.model_dump_json(), ex=int(self.ttl))
+        except Exception as e:
+            system_logger.warning(f"Redis响应缓存写入失败: {e}")
+
+    async def aclose(self) -> None:
+        """关闭Redis连接池"""
+        await self._client.aclose()
+
+
+# 不参与语义缓存分桶的请求字段（消息单独处理，其余字段均影响生成结果的形式）
+SEMANTIC_BUCKET_EXCLUDED_KEYS = frozenset({"messages", "user", "stream"})
+
+
+class SemanticCache:
+    """
+语义缓存 - 基于最后一条用户消息的向量相似度复用响应
+向量按 (模型, 生成参数, 之前的对话上下文) 分桶存储，每个桶容量有限，超出时淘汰最早的条目；
+分桶数量同样有上限，超出时淘汰最久未使用的分桶，条目全部过期的分桶直接删除
+"""
+
+    def __init__(self, threshold: float = 0.92, maxsize_per_bucket: int = 256, ttl: float = 1800.0,
+                 max_buckets: int = 1024):
+        self.threshold = threshold
+        self.maxsize_per_bucket = maxsize_per_bucket
+        self.ttl = ttl
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, List[Tuple[float, Any, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_bucket(llm_request: Dict[str, Any]) -> str:
+        """
+        根据模型、生成参数（max_tokens、stop等，不含messages/user/stream）
+        和最后一条用户消息之前的上下文（系统提示、历史对话）生成分桶键
+        """
+        messages = llm_request["messages"]
+        last_user_index = next(
+            (index for index in range(len(messages) - 1, -1, -1) if messages[index].get("role") == "user"),
+            len(messages)
+        )
+        params = {k: v for k, v in llm_request.items() if k not in SEMANTIC_BUCKET_EXCLUDED_KEYS}
+        context = json.dumps(
+            [params, messages[:last_user_index]], sort_keys=True, ensure_ascii=False, default=str
+        )
+        digest = hashlib.blake2b(context.encode("utf-8"), digest_size=8).hexdigest()
+        return f"{llm_request['model']}:{digest}"
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> Any:
+        """归一化向量，使余弦相似度等于点积（安装numpy时返回float32数组）"""
+        if np is not None:
+            array = np.asarray(vector, dtype=np.float32)
+            norm = float(np.linalg.norm(array))
+            return array / norm if norm else array
+        norm = math.sqrt(sum(map(operator.mul, vector, vector)))
+        if norm == 0:
+            return list(vector)
+        return [value / norm for value in vector]
+
+    @staticmethod
+    def _similarities(query: Any, vectors: List[Any]) -> List[float]:
+        """计算查询向量与候选向量的点积，安装numpy时一次矩阵乘法完成"""
+        if np is not None:
+            return (np.stack(vectors) @ query).tolist()
+        return [sum(map(operator.mul, query, vector)) for vector in vectors]
+
+    def lookup(self, bucket: str, vector: List[float]) -> Optional[Any]:
+        """查找相似度最高且超过阈值的缓存响应"""
+        entries = self._buckets.get(bucket)
+        if entries is not None:
+            now = time.monotonic()
+            entries[:] = [entry for entry in entries if entry[0] >= now]
+            if not entries:
+                del self._buckets[bucket]
+                self.misses += 1
+                return None
+            self._buckets.move_to_end(bucket)
+            query = self._normalize(vector)
+            candidates = [(cached_vector, value) for _, cached_vector, value in entries if len(cached_vector) == len(query)]
+            best_score, best_value = self.threshold, None
+            if candidates:
+                scores = self._similarities(query, [cached_vector for cached_vector, _ in candidates])
+                for score, (_, value) in zip(scores, candidates):
+                    if score >= best_score:
+                        best_score, best_value = score, value
+            if best_value is not None:
+                self.hits += 1
+                return best_value
+        self.misses += 1
+        return None
+
+    def add(self, bucket: str, vector: List[float], value: Any) -> None:
+        """添加缓存条目，同时清理该分桶的过期条目，分桶数超出上限时淘汰最久未使用的分桶"""
+        now = time.monotonic()
+        entries = self._buckets.get(bucket)
+        if entries is None:
+            entries = self._buckets[bucket] = []
+        else:
+            entries[:] = [entry for entry in entries if entry[0] >= now]
+            self._buckets.move_to_end(bucket)
+        entries.append((now + self.ttl, self._normalize(vector), value))
+        if len(entries) > self.maxsize_per_bucket:
+            del entries[:len(entries) - self.maxsize_per_bucket]
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._buckets.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def create_response_cache() -> Union[ResponseCache, RedisResponseCache]:
+    """根据配置创建响应缓存：配置了Redis地址时使用Redis，否则使用进程内缓存"""
+    if settings.response_cache_redis_url:
+        if redis_asyncio is None:
+            system_logger.warning("⚠️ redis库未安装，响应缓存退回进程内缓存")
+        else:
+            return RedisResponseCache(settings.response_cache_redis_url, ttl=settings.response_cache_ttl)
+    return ResponseCache(
+        maxsize=settings.response_cache_size,
+        ttl=settings.response_cache_ttl
+    )
+
+
+# 全局响应缓存实例
+response_cache = create_response_cache()
+
+# 全局语义缓存实例
+semantic_cache = SemanticCache(
+    threshold=settings.semantic_cache_threshold,
+    maxsize_per_bucket=settings.semantic_cache_size,
+    ttl=settings.response_cache_ttl,
+    max_buckets=settings.semantic_cache_max_buckets
+)
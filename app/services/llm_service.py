@@ -3,38 +3,143 @@ LLM代理服务
 基于LiteLLM实现多模型统一接口，支持详细的交互日志和指标统计
 """
 
-import uuid
+import hashlib
 import time
 import asyncio
-from typing import Dict, List, Any, Optional, AsyncGenerator, Union, Tuple
-import json
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, AsyncGenerator, Union, Tuple, Callable
+import importlib.util
 
+import httpx
 import litellm
 from litellm import completion, acompletion, embedding, aembedding
 
 from ..core.config import settings
 from ..core.logging import system_logger, llm_interaction_logger
 from ..models.api_models import (
-    ChatCompletionRequest, ChatCompletionResponse, ChatCompletionChunk,
-    ChatMessage, ChatCompletionChoice, ChatCompletionChunkChoice,
-    DeltaMessage, Usage, RequestContext,
-    EmbeddingRequest, EmbeddingResponse, EmbeddingData,
-    ToolCall, ToolCallFunction, ToolCallDelta
+    ChatCompletionRequest, ChatCompletionResponse,
+    ChatMessage, ChatCompletionChoice,
+    Usage, RequestContext,
+    EmbeddingRequest, EmbeddingResponse,
+    EmbeddingFloatData, EmbeddingBase64Data, EmbeddingArrayData,
+    ToolCall, ToolCallFunction
 )
 from ..services.metrics import metrics_collector
+from ..services.cache import response_cache, semantic_cache
+from ..services.batching import BatchCoalescer, EmbeddingBatcher, batch_coalescer, embedding_batcher
+from ..utils.helpers import (
+    floats_to_base64, floats_to_array, count_tokens, generate_request_id, create_error_response,
+    decode_token_array, is_token_array, TIKTOKEN_AVAILABLE
+)
+from ..utils.responses import sse_event, SSE_DONE
+from ..utils.clock import now_seconds
+
+
+# 直接透传给LiteLLM的通用可选参数
+CHAT_OPTIONAL_PARAMS = frozenset({
+    "temperature", "max_tokens", "top_p", "frequency_penalty",
+    "presence_penalty", "stop", "n", "user"
+})
+
+
+# LiteLLM支持的常见模型
+COMMON_MODELS: Tuple[str, ...] = (
+    # OpenAI
+    "gpt-4o-mini", "gpt-4o", "gpt-4-turbo", "gpt-4", "gpt-3.5-turbo",
+    # Anthropic
+    "claude-3-sonnet-20240229", "claude-3-haiku-20240307",
+    # Google
+    "gemini-pro", "gemini-pro-vision",
+    # Mistral
+    "mistral-small", "mistral-medium", "mistral-large",
+    # 其他
+    "command-nightly", "llama-2-70b-chat"
+)
+
+
+ToolCallFields = Tuple[Any, Any, Any, Any]
+
+# 按工具调用对象类型缓存字段提取函数，避免每个流式块重复判断类型
+_TOOL_CALL_EXTRACTORS: Dict[type, Callable[[Any], ToolCallFields]] = {}
+
+
+def _function_fields(func: Any) -> Tuple[Any, Any]:
+    """提取函数信息中的name和arguments"""
+    if isinstance(func, dict):
+        return func.get("name"), func.get("arguments")
+    return getattr(func, "name", None), getattr(func, "arguments", None)
+
+
+def _build_tool_call_extractor(cls: type) -> Callable[[Any], ToolCallFields]:
+    """为指定类型生成 (id, type, name, arguments) 提取函数"""
+    if issubclass(cls, dict):
+        def extract(tool_call: Dict[str, Any]) -> ToolCallFields:
+            return (tool_call.get("id"), tool_call.get("type"), *_function_fields(tool_call.get("function")))
+    else:
+        # pydantic模型（LiteLLM响应对象）及普通对象直接读取属性
+        def extract(tool_call: Any) -> ToolCallFields:
+            return (
+                getattr(tool_call, "id", None),
+                getattr(tool_call, "type", None),
+                *_function_fields(getattr(tool_call, "function", None))
+            )
+    return extract
+
+
+def extract_tool_call_fields(tool_call: Any) -> ToolCallFields:
+    """提取工具调用的 (id, type, name, arguments)"""
+    cls = type(tool_call)
+    extractor = _TOOL_CALL_EXTRACTORS.get(cls)
+    if extractor is None:
+        extractor = _TOOL_CALL_EXTRACTORS[cls] = _build_tool_call_extractor(cls)
+    return extractor(tool_call)
+
+
+# 始终发送的请求字段，不参与参数过滤
+REQUEST_CORE_KEYS = frozenset({"model", "messages", "stream"})
+
+# 模型支持参数的缓存条目数（模型名称来自客户端，需限制缓存大小）
+SUPPORTED_PARAMS_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=SUPPORTED_PARAMS_CACHE_SIZE)
+def get_supported_params(model: str) -> Optional[frozenset]:
+    """
+    查询并缓存模型支持的OpenAI参数集合，避免每次请求由LiteLLM重复检查
+    先解析提供商前缀（如openai/gpt-4o），使带前缀与不带前缀的模型名称得到相同的参数集合；
+    返回None表示LiteLLM无法识别该模型
+    """
+    try:
+        base_model, provider, _, _ = litellm.get_llm_provider(model=model)
+        params = litellm.get_supported_openai_params(model=base_model, custom_llm_provider=provider)
+    except Exception:
+        params = None
+    return frozenset(params) if params else None
+
+
+# 下游未返回usage时共用的零值统计
+ZERO_USAGE = Usage(prompt_tokens=0, completion_tokens=0, total_tokens=0)
+
+# 嵌入向量类型对应的数据模型，其余类型（float32数组）使用EmbeddingArrayData
+EMBEDDING_DATA_TYPES = {str: EmbeddingBase64Data, list: EmbeddingFloatData}
 
 
 class LLMService:
     """LLM代理服务"""
     
     def __init__(self):
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        # 进行中的确定性请求，相同请求共用一次下游调用
+        self._inflight: Dict[str, asyncio.Task] = {}
         self.setup_litellm()
     
     def setup_litellm(self) -> None:
         """配置LiteLLM"""
         # 基础配置
         litellm.set_verbose = settings.debug
-        litellm.drop_params = True  # 自动过滤不支持的参数
+        litellm.suppress_debug_info = not settings.debug  # 未知模型查询参数时不打印提供商列表
+        # 已知模型的参数在_prepare_litellm_request中预先过滤，未知模型按请求开启drop_params
+        litellm.drop_params = False
         litellm.request_timeout = settings.request_timeout
         
         # 如果有配置API密钥，设置默认密钥
@@ -44,14 +149,80 @@ class LLMService:
         # 如果有配置基础URL，设置默认URL
         if settings.litellm_base_url:
             litellm.api_base = settings.litellm_base_url
+
+        # 所有异步调用共享同一个长连接池，避免每次请求重复建立TCP/TLS连接
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+            ),
+            timeout=settings.request_timeout,
+            http2=importlib.util.find_spec("h2") is not None,  # 未安装h2时退回HTTP/1.1
+        )
+        litellm.aclient_session = self._client
+
+        # 预先计算常见模型支持的参数
+        for model in COMMON_MODELS:
+            get_supported_params(model)
         
         system_logger.info(f"LiteLLM配置完成 - Timeout: {settings.request_timeout}s")
+
+    async def aclose(self) -> None:
+        """关闭共享的HTTP连接池（应用关闭时调用）"""
+        if litellm.aclient_session is self._client:
+            litellm.aclient_session = None
+        await self._client.aclose()
+        await response_cache.aclose()
     
+    def _model_semaphore(self, model: str) -> Optional[asyncio.Semaphore]:
+        """获取模型对应的并发信号量，未配置并发上限时返回None"""
+        if settings.per_model_concurrency <= 0:
+            return None
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            semaphore = self._semaphores[model] = asyncio.Semaphore(settings.per_model_concurrency)
+        return semaphore
+
+    async def _acquire_model_slot(self, model: str) -> Optional[asyncio.Semaphore]:
+        """
+        等待模型的并发名额，返回已获取的信号量（调用方负责release）。
+
+        排队超过 ``queue_timeout`` 仍未获得名额时返回429。
+        """
+        semaphore = self._model_semaphore(model)
+        if semaphore is None:
+            return None
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=settings.queue_timeout)
+        except asyncio.TimeoutError:
+            raise create_error_response(
+                f"模型 {model} 并发请求过多，请稍后重试", "rate_limit_exceeded", 429
+            )
+        return semaphore
+
+    def _supports_n(self, llm_request: Dict[str, Any]) -> bool:
+        """判断合并后的带n请求能否发送（不支持时会被drop_params丢弃后逐个补发）"""
+        if llm_request.get("drop_params"):
+            return True
+        return "n" in (get_supported_params(llm_request["model"]) or ())
+
+    async def _acompletion_with_slot(self, llm_request: Dict[str, Any]) -> Any:
+        """在模型并发名额内调用LiteLLM非流式补全"""
+        semaphore = await self._acquire_model_slot(llm_request["model"])
+        try:
+            return await acompletion(**llm_request)
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
     async def create_chat_completion(self, request: ChatCompletionRequest,
-                                   user_id: Optional[str] = None) -> Union[ChatCompletionResponse, AsyncGenerator]:
-        """创建聊天补全"""
+                                   user_id: Optional[str] = None) -> Union[ChatCompletionResponse, AsyncGenerator[bytes, None]]:
+        """创建聊天补全
+
+        流式请求返回直接产出SSE字节的异步生成器，StreamingResponse无需经线程池迭代或再次编码。
+        """
         # 生成请求ID
-        request_id = str(uuid.uuid4())[:8]
+        request_id = generate_request_id()
         
         # 创建请求上下文
         context = RequestContext(
@@ -75,10 +246,11 @@ class LLMService:
             )
             
             if request.stream:
-                # 流式响应
-                return self._handle_stream_completion(
-                    request_id, llm_request, context, metrics
-                )
+                # 流式响应：先把生成器运行到获取并发名额之后再返回，超限时直接返回429；
+                # 生成器此时已启动，之后无论被迭代完、被关闭还是未迭代即被回收，都会在finally中释放名额
+                stream = self._handle_stream_completion(request_id, llm_request, context, metrics)
+                await stream.__anext__()
+                return stream
             else:
                 # 非流式响应
                 return await self._handle_non_stream_completion(
@@ -100,50 +272,19 @@ class LLMService:
     def _normalize_tool_call_entry(self, tool_call: Any) -> Optional[Dict[str, Any]]:
         """将工具调用对象标准化为dict"""
         try:
-            if hasattr(tool_call, "model_dump"):
-                data = tool_call.model_dump(exclude_none=True)
-            elif isinstance(tool_call, dict):
-                data = {k: v for k, v in tool_call.items() if v is not None}
-            else:
-                data = {
-                    "id": getattr(tool_call, "id", None),
-                    "type": getattr(tool_call, "type", None),
-                }
-                func = getattr(tool_call, "function", None)
-                if func is not None:
-                    if hasattr(func, "model_dump"):
-                        data["function"] = func.model_dump(exclude_none=True)
-                    elif isinstance(func, dict):
-                        data["function"] = {k: v for k, v in func.items() if v is not None}
-                    else:
-                        data["function"] = {
-                            "name": getattr(func, "name", None),
-                            "arguments": getattr(func, "arguments", None)
-                        }
-                elif isinstance(tool_call, dict) and isinstance(tool_call.get("function"), dict):
-                    data["function"] = tool_call["function"]
-            call_id = data.get("id")
-            func_info = data.get("function", {})
-            func_name = func_info.get("name")
-            func_args = func_info.get("arguments")
-            if call_id and func_name is not None:
-                if func_args is None:
-                    func_info["arguments"] = ""
-                else:
-                    func_info["arguments"] = str(func_args)
-                data["function"] = func_info
-                data.setdefault("type", "function")
-                return {
-                    "id": str(call_id),
-                    "type": str(data.get("type", "function")),
-                    "function": {
-                        "name": str(func_info.get("name")),
-                        "arguments": str(func_info.get("arguments", ""))
-                    }
-                }
+            call_id, call_type, func_name, func_args = extract_tool_call_fields(tool_call)
         except Exception:
             return None
-        return None
+        if not call_id or func_name is None:
+            return None
+        return {
+            "id": str(call_id),
+            "type": str(call_type or "function"),
+            "function": {
+                "name": str(func_name),
+                "arguments": "" if func_args is None else str(func_args)
+            }
+        }
 
     def _extract_tool_calls(
         self, message: Any
@@ -161,19 +302,17 @@ class LLMService:
             if not normalized:
                 continue
             log_tool_calls.append(normalized)
-            try:
-                tool_call_models.append(
-                    ToolCall(
-                        id=normalized["id"],
-                        type=normalized["type"],
-                        function=ToolCallFunction(
-                            name=normalized["function"]["name"],
-                            arguments=normalized["function"]["arguments"]
-                        )
+            # 标准化后的字段均已是字符串，直接构建跳过校验
+            tool_call_models.append(
+                ToolCall.model_construct(
+                    id=normalized["id"],
+                    type=normalized["type"],
+                    function=ToolCallFunction.model_construct(
+                        name=normalized["function"]["name"],
+                        arguments=normalized["function"]["arguments"]
                     )
                 )
-            except Exception:
-                continue
+            )
 
         return (
             tool_call_models if tool_call_models else None,
@@ -212,36 +351,32 @@ class LLMService:
             fragments: List[str] = []
             for block in content:
                 if isinstance(block, dict):
-                    # 优先提取文本字段
-                    if "text" in block and block["text"] is not None:
-                        fragments.append(str(block["text"]))
-                    elif block.get("type") in {"input_text", "output_text"} and block.get("text") is not None:
-                        fragments.append(str(block["text"]))
-                    elif block.get("type") == "image_url" and isinstance(block.get("image_url"), dict):
-                        image_url = block["image_url"].get("url")
-                        if image_url:
-                            fragments.append(f"[image:{image_url}]")
+                    # 优先提取文本字段（含input_text/output_text块）
+                    text = block.get("text")
+                    if text is not None:
+                        fragments.append(str(text))
+                        continue
+                    image_url = block.get("image_url")
+                    if isinstance(image_url, dict):
+                        url = image_url.get("url")
+                        if url:
+                            fragments.append(f"[image:{url}]")
                     else:
-                        try:
-                            fragments.append(json.dumps(block, ensure_ascii=False))
-                        except TypeError:
-                            fragments.append(str(block))
+                        # 其他块只需一个可读的占位表示，不做完整JSON编码
+                        fragments.append(repr(block) if len(block) < 8 else f"<block:{block.get('type', '?')}>")
                 else:
                     fragments.append(str(block))
-            return "\n".join([frag for frag in fragments if frag]).strip()
+            return "\n".join(filter(None, fragments)).strip()
         return str(content)
     
     def _extract_user_query(self, messages: List[ChatMessage]) -> str:
-        """提取用户查询内容"""
-        user_messages: List[str] = []
-        for msg in messages:
+        """提取用户查询内容（从后向前查找最后一条非空用户消息）"""
+        for msg in reversed(messages):
             if msg.role != "user":
                 continue
             normalized = self._normalize_message_content(msg.content)
             if normalized:
-                user_messages.append(normalized)
-        if user_messages:
-            return user_messages[-1]  # 返回最后一条用户消息
+                return normalized
         return "无用户查询"
     
     def _prepare_litellm_request(self, request: ChatCompletionRequest) -> Dict[str, Any]:
@@ -251,32 +386,8 @@ class LLMService:
         将ChatCompletionRequest对象转换为下游兼容格式，并保留OpenAI API的扩展字段，如
         工具定义（tools/functions）以及调用策略（tool_choice/function_call）。
         """
-        # 转换消息格式: role、content、name
-        messages: List[Dict[str, Any]] = []
-        for msg in request.messages:
-            m: Dict[str, Any] = {"role": msg.role}
-            # 处理content字段：允许字符串或内容块列表
-            if msg.content is not None:
-                m["content"] = msg.content
-            elif msg.tool_calls or msg.function_call:
-                # 当存在工具/函数调用时允许content为None以遵循OpenAI规范
-                m["content"] = None
-            else:
-                m["content"] = ""
-            if msg.name:
-                m["name"] = msg.name
-            if msg.tool_call_id:
-                m["tool_call_id"] = msg.tool_call_id
-            if msg.function_call:
-                m["function_call"] = msg.function_call
-            if msg.tool_calls:
-                m["tool_calls"] = [
-                    tool_call.model_dump(exclude_none=True)
-                    if hasattr(tool_call, "model_dump")
-                    else tool_call  # 允许直接传入字典
-                    for tool_call in msg.tool_calls
-                ]
-            messages.append(m)
+        # 转换消息格式：直接读取字段构建dict，避免model_dump的递归遍历
+        messages = [self._message_to_dict(msg) for msg in request.messages]
 
         llm_request: Dict[str, Any] = {
             "model": request.model,
@@ -284,15 +395,8 @@ class LLMService:
             "stream": bool(request.stream),
         }
 
-        # 通用可选参数
-        optional_params = [
-            "temperature", "max_tokens", "top_p", "frequency_penalty",
-            "presence_penalty", "stop", "n", "user"
-        ]
-        for param in optional_params:
-            value = getattr(request, param, None)
-            if value is not None:
-                llm_request[param] = value
+        # 通用可选参数（仅包含已设置的值）
+        llm_request.update(request.model_dump(include=CHAT_OPTIONAL_PARAMS, exclude_none=True))
 
         # 处理工具/函数定义
         if request.tools is not None:
@@ -307,8 +411,204 @@ class LLMService:
         elif request.function_call is not None:
             llm_request["function_call"] = request.function_call
 
+        if request.prompt_cache is not False:
+            self._apply_prompt_caching(llm_request)
+
+        self._filter_unsupported_params(llm_request)
         return llm_request
+
+    @staticmethod
+    def _message_to_dict(msg: ChatMessage) -> Dict[str, Any]:
+        """将单条消息转换为下游dict，仅包含已设置的字段"""
+        content = msg.content
+        if content is None:
+            # 当存在工具/函数调用时允许content为None以遵循OpenAI规范
+            content = None if (msg.tool_calls or msg.function_call) else ""
+        elif isinstance(content, list):
+            # 浅拷贝内容块列表，后续添加缓存标记时不修改原请求
+            content = list(content)
+        m: Dict[str, Any] = {"role": msg.role, "content": content}
+        if msg.name is not None:
+            m["name"] = msg.name
+        if msg.tool_calls is not None:
+            m["tool_calls"] = [
+                {
+                    "id": tool_call.id,
+                    "type": tool_call.type,
+                    "function": {
+                        "name": tool_call.function.name,
+                        "arguments": tool_call.function.arguments
+                    }
+                }
+                for tool_call in msg.tool_calls
+            ]
+        if msg.tool_call_id is not None:
+            m["tool_call_id"] = msg.tool_call_id
+        if msg.function_call is not None:
+            m["function_call"] = msg.function_call
+        return m
+
+    def _filter_unsupported_params(self, llm_request: Dict[str, Any]) -> None:
+        """按模型支持的参数集合过滤请求，无法确定时交由LiteLLM的drop_params处理"""
+        supported = get_supported_params(llm_request["model"])
+        if supported is None:
+            llm_request["drop_params"] = True
+            return
+        for key in [key for key in llm_request if key not in REQUEST_CORE_KEYS and key not in supported]:
+            del llm_request[key]
+
+    def _apply_prompt_caching(self, llm_request: Dict[str, Any]) -> None:
+        """
+        为首条system消息添加提供商侧提示缓存标记。
+
+        Claude模型将system内容转换为带 ``cache_control`` 的结构化内容块；
+        OpenAI gpt模型根据system内容生成 ``prompt_cache_key``，使相同前缀的请求路由到同一缓存。
+        """
+        system_message = next(
+            (msg for msg in llm_request["messages"] if msg.get("role") == "system"),
+            None
+        )
+        if not system_message or not system_message.get("content"):
+            return
+
+        model_name = llm_request["model"].rsplit("/", 1)[-1]
+        if model_name.startswith("claude-"):
+            content = system_message["content"]
+            if isinstance(content, str):
+                system_message["content"] = [
+                    {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
+                ]
+            elif isinstance(content, list) and isinstance(content[-1], dict):
+                # 已是内容块列表时标记最后一块，缓存覆盖到此为止的全部前缀
+                content[-1] = {**content[-1], "cache_control": {"type": "ephemeral"}}
+        elif model_name.startswith("gpt-"):
+            system_content = self._normalize_message_content(system_message["content"])
+            llm_request["prompt_cache_key"] = hashlib.sha256(system_content.encode()).hexdigest()[:32]
     
+    def _complete_from_cache(
+        self, request_id: str, cached_response: ChatCompletionResponse, cache_type: str
+    ) -> ChatCompletionResponse:
+        """使用缓存响应完成请求（不消耗下游token）"""
+        llm_interaction_logger.complete_interaction(
+            request_id,
+            {"cache_hit": cache_type, "id": cached_response.id},
+            0.0,
+            success=True
+        )
+        metrics_collector.complete_request(request_id, success=True, cache_hit=True)
+        return cached_response
+
+    def _complete_from_inflight(
+        self, request_id: str, shared_response: ChatCompletionResponse
+    ) -> ChatCompletionResponse:
+        """
+        使用进行中的相同请求的结果完成请求（不消耗下游token）
+        返回独立副本，避免后续按请求的修改影响其他调用方；指标按去重计数，不计为缓存命中
+        """
+        llm_interaction_logger.complete_interaction(
+            request_id,
+            {"deduplicated": True, "id": shared_response.id},
+            0.0,
+            success=True
+        )
+        metrics_collector.complete_request(request_id, success=True, deduplicated=True)
+        return shared_response.model_copy(deep=True)
+
+    def _semantic_cache_applicable(self, llm_request: Dict[str, Any]) -> bool:
+        """判断请求是否适用语义缓存：低temperature、单个choice、无结构化输出要求且不涉及工具调用"""
+        if not settings.enable_semantic_cache:
+            return False
+        if (llm_request.get("temperature") or 0) > settings.semantic_cache_max_temperature:
+            return False
+        if (llm_request.get("n") or 1) > 1 or llm_request.get("response_format"):
+            return False
+        return not any(llm_request.get(key) for key in ("tools", "functions"))
+
+    async def _embed_cache_query(self, messages: List[Dict[str, Any]]) -> Optional[List[float]]:
+        """对最后一条用户消息生成向量，失败时返回None（不影响正常请求）"""
+        query = next(
+            (
+                self._normalize_message_content(msg.get("content"))
+                for msg in reversed(messages)
+                if msg.get("role") == "user"
+            ),
+            ""
+        )
+        if not query:
+            return None
+        try:
+            response = await aembedding(model=settings.semantic_cache_embedding_model, input=[query])
+            return list(response.data[0]["embedding"])
+        except Exception as e:
+            system_logger.warning(f"语义缓存向量生成失败，跳过缓存: {e}")
+            return None
+
+    def _start_inflight(self, key: str, llm_request: Dict[str, Any]) -> asyncio.Task:
+        """登记进行中的下游调用，完成后自动移除"""
+        task = asyncio.ensure_future(self._fetch_completion(llm_request))
+        self._inflight[key] = task
+
+        def _release(done: asyncio.Task) -> None:
+            if self._inflight.get(key) is done:
+                del self._inflight[key]
+
+        task.add_done_callback(_release)
+        return task
+
+    async def _fetch_completion(self, llm_request: Dict[str, Any]) -> Tuple[ChatCompletionResponse, float]:
+        """调用下游并转换为响应模型，返回响应和下游耗时"""
+        # 记录下游请求时间（包含并发排队和合并窗口的等待）
+        downstream_start = time.perf_counter()
+
+        # 调用LiteLLM，开启请求合并时与并发的相同请求共用一次调用
+        if (
+            settings.enable_request_batching
+            and BatchCoalescer.applicable(llm_request)
+            and self._supports_n(llm_request)
+        ):
+            response = await batch_coalescer.submit(llm_request, self._acompletion_with_slot)
+        else:
+            response = await self._acompletion_with_slot(llm_request)
+
+        downstream_time = time.perf_counter() - downstream_start
+
+        # 转换为我们的响应格式（数据来自LiteLLM已解析的响应，直接构建跳过重复校验；
+        # model_construct只用于这类可信数据，客户端输入仍需经过完整校验）
+        choices: List[ChatCompletionChoice] = []
+        for choice in response.choices:
+            message = choice.message
+            # 解析工具调用（如果有）
+            tool_calls_list, _ = self._extract_tool_calls(message)
+            chat_msg = ChatMessage.model_construct(
+                role=message.role,
+                content=message.content,
+                tool_call_id=getattr(message, "tool_call_id", None),
+                tool_calls=tool_calls_list,
+                function_call=self._extract_function_call_payload(message)
+            )
+            choices.append(
+                ChatCompletionChoice.model_construct(
+                    index=choice.index,
+                    message=chat_msg,
+                    finish_reason=choice.finish_reason
+                )
+            )
+
+        usage_obj = response.usage
+        usage = Usage.model_construct(
+            prompt_tokens=usage_obj.prompt_tokens,
+            completion_tokens=usage_obj.completion_tokens,
+            total_tokens=usage_obj.total_tokens
+        ) if usage_obj else None
+
+        completion_response = ChatCompletionResponse.model_construct(
+            id=response.id,
+            model=response.model,
+            choices=choices,
+            usage=usage
+        )
+        return completion_response, downstream_time
+
     async def _handle_non_stream_completion(
         self, request_id: str, llm_request: Dict[str, Any],
         context: RequestContext, metrics
@@ -316,165 +616,190 @@ class LLMService:
         """处理非流式补全"""
         
         try:
-            # 记录下游请求时间
-            downstream_start = time.time()
-            
-            # 调用LiteLLM
-            response = await acompletion(**llm_request)
-            
-            downstream_time = time.time() - downstream_start
-            
-            # 记录下游响应
-            response_data = {
-                "id": response.id,
-                "model": response.model,
-                "choices": [
-                    {
-                        "index": choice.index,
-                        "message": {
-                            "role": choice.message.role,
-                            "content": choice.message.content
-                        },
-                        "finish_reason": choice.finish_reason
-                    }
-                    for choice in response.choices
-                ],
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
-                    "completion_tokens": response.usage.completion_tokens if response.usage else 0,
-                    "total_tokens": response.usage.total_tokens if response.usage else 0
-                }
-            }
-            
-            # 转换为我们的响应格式
-            converted_choices: List[ChatCompletionChoice] = []
-            for list_index, choice in enumerate(response.choices):
-                # 解析工具调用（如果有）
-                tool_calls_list, log_tool_calls = self._extract_tool_calls(choice.message)
-                function_call_payload = self._extract_function_call_payload(choice.message)
-
-                # 构建日志用message
-                message_payload: Dict[str, Any] = {
-                    "role": choice.message.role,
-                    "content": choice.message.content
-                }
-                if getattr(choice.message, "tool_call_id", None):
-                    message_payload["tool_call_id"] = choice.message.tool_call_id
-                if log_tool_calls:
-                    message_payload["tool_calls"] = log_tool_calls
-                if function_call_payload:
-                    message_payload["function_call"] = function_call_payload
-
-                # 更新日志数据choices
-                if list_index < len(response_data["choices"]):
-                    response_data["choices"][list_index]["message"] = message_payload
-
-                # 构建ChatMessage
-                msg_content = choice.message.content if choice.message.content is not None else None
-                tool_call_id = getattr(choice.message, "tool_call_id", None)
-                chat_msg = ChatMessage(
-                    role=choice.message.role,
-                    content=msg_content,
-                    tool_call_id=tool_call_id,
-                    tool_calls=tool_calls_list,
-                    function_call=function_call_payload
-                )
-                converted_choices.append(
-                    ChatCompletionChoice(
-                        index=choice.index,
-                        message=chat_msg,
-                        finish_reason=choice.finish_reason
-                    )
-                )
+            # 精确匹配缓存：仅缓存确定性（temperature为0或未设置）的请求
+            request_key: Optional[str] = None
+            cache_key: Optional[str] = None
+            if not llm_request.get("temperature"):
+                request_key = response_cache.make_key(llm_request)
+                if settings.enable_response_cache:
+                    cache_key = request_key
+                    cached_response = await response_cache.aget(cache_key)
+                    if cached_response is not None:
+                        return self._complete_from_cache(request_id, cached_response, "exact")
 
-            choices = converted_choices
-            
-            usage = None
-            if response.usage:
-                usage = Usage(
-                    prompt_tokens=response.usage.prompt_tokens,
-                    completion_tokens=response.usage.completion_tokens,
-                    total_tokens=response.usage.total_tokens
-                )
+            # 语义缓存：精确匹配未命中时，按最后一条用户消息的向量相似度查找
+            semantic_bucket: Optional[str] = None
+            query_vector: Optional[List[float]] = None
+            if self._semantic_cache_applicable(llm_request):
+                semantic_bucket = semantic_cache.make_bucket(llm_request)
+                query_vector = await self._embed_cache_query(llm_request["messages"])
+                if query_vector is not None:
+                    cached_response = semantic_cache.lookup(semantic_bucket, query_vector)
+                    if cached_response is not None:
+                        return self._complete_from_cache(request_id, cached_response, "semantic")
+
+            if request_key is not None and settings.enable_inflight_dedup:
+                # 相同的确定性请求正在进行时直接等待其结果，不再重复调用下游
+                task = self._inflight.get(request_key)
+                if task is not None:
+                    shared_response, _ = await asyncio.shield(task)
+                    return self._complete_from_inflight(request_id, shared_response)
+                task = self._start_inflight(request_key, llm_request)
+                # shield：当前请求被取消时不影响其他等待同一结果的请求
+                completion_response, downstream_time = await asyncio.shield(task)
+            else:
+                completion_response, downstream_time = await self._fetch_completion(llm_request)
+            usage = completion_response.usage
 
-            # 完成交互记录（包含工具调用信息）
+            # 完成交互记录（日志数据在输出时由响应模型序列化得到）
             llm_interaction_logger.complete_interaction(
-                request_id, response_data, downstream_time, success=True
+                request_id, completion_response, downstream_time, success=True
             )
 
-            # 获取token使用情况用于指标
-            prompt_tokens = response.usage.prompt_tokens if response.usage else 0
-            completion_tokens = response.usage.completion_tokens if response.usage else 0
-            
             # 完成指标记录
             metrics_collector.complete_request(
                 request_id,
                 success=True,
-                prompt_tokens=prompt_tokens,
-                completion_tokens=completion_tokens
+                prompt_tokens=usage.prompt_tokens if usage else 0,
+                completion_tokens=usage.completion_tokens if usage else 0,
+                cache_hit=False if cache_key is not None or query_vector is not None else None
             )
             
-            return ChatCompletionResponse(
-                id=response.id,
-                model=response.model,
-                choices=choices,
-                usage=usage
-            )
+            if cache_key is not None:
+                await response_cache.aset(cache_key, completion_response)
+            if query_vector is not None:
+                semantic_cache.add(semantic_bucket, query_vector, completion_response)
+            return completion_response
         
         except Exception as e:
             llm_interaction_logger.log_error_interaction(request_id, e, "non_stream_completion")
             raise e
     
+    def _finalize_stream(
+        self, llm_request: Dict[str, Any], content_parts: List[str], finish_reason: Optional[str],
+        tool_call_chunks: int, prompt_tokens: int, completion_tokens: int,
+        tool_call_accumulator: Dict[str, Dict[str, Any]],
+        function_call_accumulator: Optional[Dict[str, Any]], log_enabled: bool
+    ) -> Tuple[int, int, Optional[Dict[str, Any]]]:
+        """
+        流式响应结束后的同步收尾（在线程中执行）
+        下游未返回usage时估算输入和输出token，并构建日志摘要（交互日志被过滤时不构建）
+        """
+        model = llm_request["model"]
+        accumulated_content = "".join(content_parts)
+
+        if not prompt_tokens:
+            # 逐条累加，不拼接整个上下文
+            prompt_tokens = sum(
+                count_tokens(self._normalize_message_content(msg.get("content")), model)
+                for msg in llm_request["messages"]
+            )
+        if not completion_tokens:
+            completion_tokens = count_tokens(accumulated_content, model)
+
+        if not log_enabled:
+            return prompt_tokens, completion_tokens, None
+
+        # 记录下游响应摘要
+        response_summary: Dict[str, Any] = {
+            "content": accumulated_content,
+            "finish_reason": finish_reason,
+            # 块数由内容片段和工具调用增量推算，流式循环中不单独计数
+            "chunk_count": len(content_parts) + tool_call_chunks,
+            "estimated_tokens": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+        if tool_call_accumulator:
+            response_summary["tool_calls"] = [
+                {
+                    "id": call_id,
+                    "type": data["type"],
+                    "function": {
+                        "name": data["name"],
+                        "arguments": "".join(data["arguments_parts"])
+                    }
+                }
+                for call_id, data in tool_call_accumulator.items()
+            ]
+        if function_call_accumulator:
+            response_summary["function_call"] = {
+                "name": function_call_accumulator["name"],
+                "arguments": "".join(function_call_accumulator["arguments_parts"])
+            }
+        return prompt_tokens, completion_tokens, response_summary
+
     async def _handle_stream_completion(
         self, request_id: str, llm_request: Dict[str, Any],
         context: RequestContext, metrics
-    ) -> AsyncGenerator[str, None]:
-        """处理流式补全"""
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        处理流式补全
+        首个产出为空字节，表示已获得模型并发名额（由create_chat_completion消费，不发送给客户端）
+        """
         
-        accumulated_content = ""
-        chunk_count = 0
+        content_parts: List[str] = []
+        tool_call_chunks = 0
         finish_reason = None
         prompt_tokens = 0
         completion_tokens = 0
         tool_call_accumulator: Dict[str, Dict[str, Any]] = {}
         function_call_accumulator: Optional[Dict[str, Any]] = None
-        
+
+        # 排队超时的429在生成器启动时直接抛出
+        semaphore = await self._acquire_model_slot(llm_request["model"])
         try:
+            yield b""
+
             # 记录下游请求时间
-            downstream_start = time.time()
+            downstream_start = time.perf_counter()
             
             # 调用LiteLLM流式API
             response_stream = await acompletion(**llm_request)
-            
+
+            # 循环内频繁调用的方法预先绑定为局部变量
+            append_content = content_parts.append
+            get_tool_call = tool_call_accumulator.get
+
             async for chunk in response_stream:
-                chunk_count += 1
+                # 下游在流中返回usage时以其为准
+                chunk_usage = getattr(chunk, "usage", None)
+                if chunk_usage:
+                    prompt_tokens = chunk_usage.prompt_tokens or prompt_tokens
+                    completion_tokens = chunk_usage.completion_tokens or 0
                 
-                if chunk.choices:
-                    choice = chunk.choices[0]
-                    
-                    # 累积内容
-                    if choice.delta.content:
-                        accumulated_content += choice.delta.content
-                        
-                        # 流式块记录已集成到最终响应中
+                choices = chunk.choices
+                if choices:
+                    choice = choices[0]
+                    # 每个块的增量字段只读取一次
+                    delta = choice.delta
+                    content = getattr(delta, "content", None)
+                    role = getattr(delta, "role", None)
+                    fc_delta = getattr(delta, "function_call", None)
+                    tool_calls = getattr(delta, "tool_calls", None)
+                    chunk_finish_reason = choice.finish_reason
                     
                     # 记录完成原因
-                    if choice.finish_reason:
-                        finish_reason = choice.finish_reason
+                    if chunk_finish_reason:
+                        finish_reason = chunk_finish_reason
                     
-                    # 构建响应块
-                    delta = DeltaMessage()
+                    # 构建响应块（数据来自下游，跳过校验）
+                    delta_fields: Dict[str, Any] = {}
                     # 设置角色
-                    if getattr(choice.delta, "role", None):
-                        delta.role = choice.delta.role
-                    # 设置内容
-                    if getattr(choice.delta, "content", None):
-                        delta.content = choice.delta.content
+                    if role:
+                        delta_fields["role"] = role
+                    # 设置内容并累积
+                    if content:
+                        append_content(content)
+                        delta_fields["content"] = content
                     # 解析工具调用增量
-                    tool_calls_delta: Optional[List[ToolCallDelta]] = None
+                    tool_calls_delta: Optional[List[Dict[str, Any]]] = None
                     # 兼容旧版function_call增量
-                    if getattr(choice.delta, "function_call", None):
-                        fc_delta = choice.delta.function_call
+                    if fc_delta:
+                        tool_call_chunks += 1
                         fc_payload: Optional[Dict[str, Any]] = None
                         if hasattr(fc_delta, "model_dump"):
                             fc_payload = fc_delta.model_dump(exclude_none=True)
@@ -490,118 +815,68 @@ class LLMService:
                             if function_call_accumulator is None:
                                 function_call_accumulator = {
                                     "name": fc_payload.get("name"),
-                                    "arguments": ""
+                                    "arguments_parts": []
                                 }
                             if fc_payload.get("name"):
                                 function_call_accumulator["name"] = fc_payload["name"]
                             if fc_payload.get("arguments"):
-                                function_call_accumulator["arguments"] = (
-                                    function_call_accumulator.get("arguments", "") + fc_payload["arguments"]
-                                )
-                            delta.function_call = fc_payload
-                    if hasattr(choice.delta, "tool_calls") and choice.delta.tool_calls:
+                                function_call_accumulator["arguments_parts"].append(fc_payload["arguments"])
+                            delta_fields["function_call"] = fc_payload
+                    if tool_calls:
+                        tool_call_chunks += 1
                         tool_calls_delta = []
-                        for tc in choice.delta.tool_calls:
+                        for tc in tool_calls:
                             try:
-                                tc_id = getattr(tc, "id", None)
-                                if tc_id is None and isinstance(tc, dict):
-                                    tc_id = tc.get("id")
-                                tc_type = getattr(tc, "type", None)
-                                if tc_type is None and isinstance(tc, dict):
-                                    tc_type = tc.get("type")
-                                # 函数信息
-                                if hasattr(tc, "function"):
-                                    func = tc.function
-                                    func_name = getattr(func, "name", None)
-                                    func_args = getattr(func, "arguments", None)
-                                elif isinstance(tc, dict) and isinstance(tc.get("function"), dict):
-                                    func_name = tc["function"].get("name")
-                                    func_args = tc["function"].get("arguments")
-                                else:
-                                    func_name = None
-                                    func_args = None
+                                tc_id, tc_type, func_name, func_args = extract_tool_call_fields(tc)
                                 # 构建增量对象
                                 if func_name is not None and func_args is not None:
-                                    tool_calls_delta.append(
-                                        ToolCallDelta(
-                                            id=tc_id,
-                                            type=tc_type,
-                                            function=ToolCallFunction(
-                                                name=str(func_name), arguments=str(func_args)
-                                            )
-                                        )
-                                    )
+                                    tool_calls_delta.append({
+                                        "id": tc_id,
+                                        "type": tc_type,
+                                        "function": {"name": str(func_name), "arguments": str(func_args)}
+                                    })
                                     # 累积工具调用信息
                                     call_id = str(tc_id) if tc_id else None
                                     if call_id:
-                                        existing = tool_call_accumulator.get(call_id, {
-                                            "id": call_id,
-                                            "type": str(tc_type) if tc_type else "function",
-                                            "function": {"name": None, "arguments": ""}
-                                        })
+                                        existing = get_tool_call(call_id)
+                                        if existing is None:
+                                            existing = tool_call_accumulator[call_id] = {
+                                                "type": str(tc_type) if tc_type else "function",
+                                                "name": None,
+                                                "arguments_parts": []
+                                            }
                                         if func_name:
-                                            existing["function"]["name"] = str(func_name)
+                                            existing["name"] = str(func_name)
                                         if func_args:
-                                            prev_args = existing["function"].get("arguments") or ""
-                                            existing["function"]["arguments"] = prev_args + str(func_args)
-                                        tool_call_accumulator[call_id] = existing
+                                            existing["arguments_parts"].append(str(func_args))
                             except Exception:
                                 continue
                     if tool_calls_delta:
-                        delta.tool_calls = tool_calls_delta
-                    
-                    chunk_choice = ChatCompletionChunkChoice(
-                        index=choice.index,
-                        delta=delta,
-                        finish_reason=choice.finish_reason
-                    )
+                        delta_fields["tool_calls"] = tool_calls_delta
                     
-                    response_chunk = ChatCompletionChunk(
-                        id=chunk.id,
-                        model=chunk.model,
-                        choices=[chunk_choice]
-                    )
-                    
-                    yield f"data: {response_chunk.model_dump_json()}\n\n"
-            
-            downstream_time = time.time() - downstream_start
+                    yield sse_event({
+                        "id": chunk.id,
+                        "object": "chat.completion.chunk",
+                        "created": now_seconds(),
+                        "model": chunk.model,
+                        "choices": [{
+                            "index": choice.index,
+                            "delta": delta_fields,
+                            "finish_reason": chunk_finish_reason
+                        }]
+                    })
             
-            # 估算token使用（LiteLLM流式可能没有usage）
-            if accumulated_content:
-                # 简单估算：1 token ≈ 4 字符（英文）或 1.5 字符（中文）
-                completion_tokens = max(1, len(accumulated_content) // 3)
-            
-            # 估算输入token（基于请求消息长度）
-            if prompt_tokens == 0:
-                total_input_text = " ".join([msg["content"] for msg in llm_request["messages"] if msg.get("content")])
-                prompt_tokens = max(1, len(total_input_text) // 3)  # 使用相同的估算方法
-            
-            # 记录下游响应摘要
-            response_summary = {
-                "content": accumulated_content,
-                "finish_reason": finish_reason,
-                "chunk_count": chunk_count,
-                "estimated_tokens": {
-                    "prompt_tokens": prompt_tokens,
-                    "completion_tokens": completion_tokens,
-                    "total_tokens": prompt_tokens + completion_tokens
-                }
-            }
-
-            if tool_call_accumulator:
-                response_summary["tool_calls"] = [
-                    {
-                        "id": call_id,
-                        "type": data.get("type", "function"),
-                        "function": {
-                            "name": data.get("function", {}).get("name"),
-                            "arguments": data.get("function", {}).get("arguments", "")
-                        }
-                    }
-                    for call_id, data in tool_call_accumulator.items()
-                ]
-            if function_call_accumulator:
-                response_summary["function_call"] = function_call_accumulator
+            downstream_time = time.perf_counter() - downstream_start
+            log_enabled = llm_interaction_logger.is_enabled("INFO")
+            response_summary: Optional[Dict[str, Any]] = None
+            if log_enabled or not prompt_tokens or not completion_tokens:
+                # 拼接内容、估算token和构建摘要在线程中完成，不阻塞其他流式响应
+                prompt_tokens, completion_tokens, response_summary = await asyncio.to_thread(
+                    self._finalize_stream,
+                    llm_request, content_parts, finish_reason, tool_call_chunks,
+                    prompt_tokens, completion_tokens,
+                    tool_call_accumulator, function_call_accumulator, log_enabled
+                )
             
             # 完成交互记录
             llm_interaction_logger.complete_interaction(
@@ -617,7 +892,7 @@ class LLMService:
             )
             
             # 发送结束标记
-            yield "data: [DONE]\n\n"
+            yield SSE_DONE
         
         except Exception as e:
             llm_interaction_logger.log_error_interaction(request_id, e, "stream_completion")
@@ -634,39 +909,30 @@ class LLMService:
                     "type": "stream_error"
                 }
             }
-            yield f"data: {json.dumps(error_chunk)}\n\n"
+            yield sse_event(error_chunk)
+
+        finally:
+            if semaphore is not None:
+                semaphore.release()
 
     def _try_decode_tokens(self, input_data) -> Optional[str]:
         """
         尝试将tokenized数组解码为文本
-        如果输入是token数组，尝试使用tiktoken解码
+        调用方已确认输入为非空token数组，使用tiktoken解码
         """
+        if not TIKTOKEN_AVAILABLE:
+            system_logger.warning("⚠️ tiktoken库未安装，无法解码token数组")
+            return None
         try:
-            import tiktoken
-
-            # 检查是否是token数组
-            if isinstance(input_data, list) and len(input_data) > 0:
-                if all(isinstance(x, int) for x in input_data):
-                    # 尝试使用不同的编码器解码
-                    encoders = ["cl100k_base", "gpt2", "r50k_base", "p50k_base"]
-
-                    for encoder_name in encoders:
-                        try:
-                            encoding = tiktoken.get_encoding(encoder_name)
-                            decoded_text = encoding.decode(input_data)
-                            if decoded_text and len(decoded_text.strip()) > 0:
-                                system_logger.info(f"🔄 自动解码token数组 ({encoder_name}): {len(input_data)} tokens -> '{decoded_text[:50]}...'")
-                                return decoded_text
-                        except Exception:
-                            continue
-
-                    # 如果所有编码器都失败，返回None
-                    system_logger.warning(f"⚠️ 无法解码token数组: {input_data[:10]}...")
-                    return None
+            # 按token id范围确定编码尝试顺序（编码器和解码结果均已缓存）
+            decoded = decode_token_array(input_data)
+            if decoded is not None:
+                encoder_name, decoded_text = decoded
+                system_logger.info("🔄 自动解码token数组 ({}): {} tokens -> '{}...'", encoder_name, len(input_data), decoded_text[:50])
+                return decoded_text
 
-            return None
-        except ImportError:
-            system_logger.warning("⚠️ tiktoken库未安装，无法解码token数组")
+            # 如果所有编码器都失败，返回None
+            system_logger.warning("⚠️ 无法解码token数组: {}...", input_data[:10])
             return None
         except Exception as e:
             system_logger.error(f"解码token数组时出错: {e}")
@@ -676,46 +942,40 @@ class LLMService:
         """
         预处理嵌入输入，支持自动token解码
         """
-        processed_input = request.input
-
-        # 处理单个输入
-        if isinstance(request.input, list) and len(request.input) > 0:
-            # 检查是否是token数组 (所有元素都是int)
-            if all(isinstance(x, int) for x in request.input):
-                decoded_text = self._try_decode_tokens(request.input)
-                if decoded_text:
-                    processed_input = decoded_text
-                    system_logger.info(f"✅ 成功解码tokenized输入为文本")
-                else:
-                    # 如果解码失败，抛出友好的错误
-                    raise ValueError(
-                        "检测到tokenized数字数组但无法解码。请发送原始文本字符串而不是token数组。"
-                        f"\n正确格式: '原始文本字符串'"
-                        f"\n错误格式: {request.input[:10]}..."
-                    )
-            # 处理列表中包含token数组的情况
-            elif any(isinstance(item, list) and all(isinstance(x, int) for x in item) for item in request.input if isinstance(item, list)):
-                processed_list = []
-                for item in request.input:
-                    if isinstance(item, list) and all(isinstance(x, int) for x in item):
-                        decoded_text = self._try_decode_tokens(item)
-                        if decoded_text:
-                            processed_list.append(decoded_text)
-                        else:
-                            raise ValueError(f"无法解码token数组: {item[:10]}...")
-                    else:
-                        processed_list.append(item)
-                processed_input = processed_list
-                system_logger.info(f"✅ 成功解码列表中的tokenized输入")
+        # 字符串或空列表无需处理，直接返回原请求
+        if not isinstance(request.input, list) or not request.input:
+            return request
 
-        # 创建处理后的请求对象
-        return EmbeddingRequest(
-            input=processed_input,
-            model=request.model,
-            encoding_format=request.encoding_format,
-            dimensions=request.dimensions,
-            user=request.user
-        )
+        # 检查是否是token数组 (所有元素都是int)
+        if is_token_array(request.input):
+            decoded_text = self._try_decode_tokens(request.input)
+            if not decoded_text:
+                # 如果解码失败，抛出友好的错误
+                raise ValueError(
+                    "检测到tokenized数字数组但无法解码。请发送原始文本字符串而不是token数组。"
+                    f"\n正确格式: '原始文本字符串'"
+                    f"\n错误格式: {request.input[:10]}..."
+                )
+            system_logger.info(f"✅ 成功解码tokenized输入为文本")
+            return request.model_copy(update={"input": decoded_text})
+
+        # 处理列表中包含token数组的情况（单次遍历）
+        processed_list = []
+        decoded_any = False
+        for item in request.input:
+            if is_token_array(item):
+                decoded_text = self._try_decode_tokens(item)
+                if not decoded_text:
+                    raise ValueError(f"无法解码token数组: {item[:10]}...")
+                processed_list.append(decoded_text)
+                decoded_any = True
+            else:
+                processed_list.append(item)
+
+        if not decoded_any:
+            return request
+        system_logger.info(f"✅ 成功解码列表中的tokenized输入")
+        return request.model_copy(update={"input": processed_list})
 
     async def create_embeddings(self, request: EmbeddingRequest,
                                user_id: Optional[str] = None) -> EmbeddingResponse:
@@ -728,7 +988,7 @@ class LLMService:
             raise ValueError(str(e))
 
         # 生成请求ID
-        request_id = str(uuid.uuid4())[:8]
+        request_id = generate_request_id()
 
         # 创建请求上下文
         context = RequestContext(
@@ -786,8 +1046,15 @@ class LLMService:
         if request.encoding_format:
             llm_request["encoding_format"] = request.encoding_format
 
+        # 嵌入参数因提供商而异，交由LiteLLM过滤不支持的参数
+        llm_request["drop_params"] = True
         return llm_request
 
+    @staticmethod
+    async def _aembedding(llm_request: Dict[str, Any]) -> Any:
+        """调用LiteLLM嵌入API（供请求合并使用）"""
+        return await aembedding(**llm_request)
+
     async def _handle_embedding_request(
         self, request_id: str, llm_request: Dict[str, Any],
         context: RequestContext, metrics
@@ -796,95 +1063,79 @@ class LLMService:
 
         try:
             # 记录下游请求时间
-            downstream_start = time.time()
+            downstream_start = time.perf_counter()
 
-            # 调用LiteLLM嵌入API
-            response = await aembedding(**llm_request)
+            # 调用LiteLLM嵌入API，开启合并时与并发的嵌入请求共用一次调用
+            if settings.enable_embedding_batching and EmbeddingBatcher.applicable(llm_request):
+                response = await embedding_batcher.submit(llm_request, self._aembedding)
+            else:
+                response = await aembedding(**llm_request)
 
-            downstream_time = time.time() - downstream_start
+            downstream_time = time.perf_counter() - downstream_start
 
             # 处理LiteLLM响应 - 根据实际测试，LiteLLM返回的是对象格式
             # 但 data 字段包含的是字典列表，不是对象列表
-            response_data = {
-                "object": "list",
-                "data": [
-                    {
-                        "object": "embedding",
-                        "embedding": data["embedding"],  # data是字典，使用字典访问
-                        "index": data["index"]
-                    }
-                    for data in response.data
-                ],
-                "model": response.model,
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
-                    "total_tokens": response.usage.total_tokens if response.usage else 0
-                }
-            }
-            model_name = response.model
-            usage_info = response.usage if response.usage else {}
-
-            # 完成交互记录
-            llm_interaction_logger.complete_interaction(
-                request_id, response_data, downstream_time, success=True
+            # 客户端请求base64但下游返回浮点数组时，直接打包为float32字节再编码
+            # 否则（开启时）转为float32数组，之后的日志截断和序列化都基于该数组
+            encode = (
+                floats_to_base64 if llm_request.get("encoding_format") == "base64"
+                else floats_to_array if settings.embedding_float32_arrays
+                else None
             )
+            # 转换为我们的响应格式，一次遍历完成编码和数据模型构建
+            # LiteLLM返回对象格式，但data是字典列表
+            # 按编码格式选择具体的数据模型；数据来自LiteLLM，直接构建跳过校验，向量列表原样复用
+            embedding_data = []
+            for data in response.data:
+                embedding = data["embedding"]  # data是字典，使用字典访问
+                if encode is not None and isinstance(embedding, list):
+                    embedding = encode(embedding)
+                embedding_data.append(
+                    EMBEDDING_DATA_TYPES.get(type(embedding), EmbeddingArrayData).model_construct(
+                        embedding=embedding,
+                        index=data["index"]
+                    )
+                )
 
-            # 获取token使用情况用于指标
-            prompt_tokens = usage_info.get("prompt_tokens", 0)
-            total_tokens = usage_info.get("total_tokens", 0)
+            usage_obj = response.usage
+            prompt_tokens = usage_obj.prompt_tokens if usage_obj else 0
+            total_tokens = usage_obj.total_tokens if usage_obj else 0
 
-            # 完成指标记录
-            metrics_collector.complete_request(
-                request_id,
-                success=True,
+            usage = Usage.model_construct(
                 prompt_tokens=prompt_tokens,
                 completion_tokens=0,  # embeddings没有completion tokens
                 total_tokens=total_tokens
+            ) if usage_obj else ZERO_USAGE
+
+            embedding_response = EmbeddingResponse.model_construct(
+                data=embedding_data,
+                model=response.model,
+                usage=usage
             )
 
-            # 转换为我们的响应格式
-            # LiteLLM返回对象格式，但data是字典列表
-            embedding_data = [
-                EmbeddingData(
-                    embedding=data["embedding"],  # data是字典，使用字典访问
-                    index=data["index"]
-                )
-                for data in response.data
-            ]
+            # 完成交互记录（日志数据在输出时由响应模型序列化得到）
+            llm_interaction_logger.complete_interaction(
+                request_id, embedding_response, downstream_time, success=True
+            )
 
-            usage = Usage(
+            # 完成指标记录
+            metrics_collector.complete_request(
+                request_id,
+                success=True,
                 prompt_tokens=prompt_tokens,
                 completion_tokens=0,  # embeddings没有completion tokens
                 total_tokens=total_tokens
             )
 
-            return EmbeddingResponse(
-                data=embedding_data,
-                model=model_name,
-                usage=usage
-            )
+            return embedding_response
 
         except Exception as e:
             llm_interaction_logger.log_error_interaction(request_id, e, "embedding_request")
             raise e
 
-    def get_available_models(self) -> List[str]:
+    def get_available_models(self) -> Tuple[str, ...]:
         """获取可用模型列表"""
-        # LiteLLM支持的常见模型
-        common_models = [
-            # OpenAI
-            "gpt-4o-mini", "gpt-4o", "gpt-4-turbo", "gpt-4", "gpt-3.5-turbo",
-            # Anthropic
-            "claude-3-sonnet-20240229", "claude-3-haiku-20240307",
-            # Google
-            "gemini-pro", "gemini-pro-vision",
-            # Mistral
-            "mistral-small", "mistral-medium", "mistral-large",
-            # 其他
-            "command-nightly", "llama-2-70b-chat"
-        ]
-        
-        return common_models
+        return COMMON_MODELS
 
 
 # 全局LLM服务实例
@@ -3,18 +3,25 @@
 跟踪和统计API使用情况、性能指标等
 """
 
+import secrets
+import sys
 import time
 from typing import Dict, List, Optional
-from collections import defaultdict, deque
+from collections import Counter, deque
+from contextlib import nullcontext
 from dataclasses import dataclass, field
 from threading import Lock
 
+from ..core.config import settings
 from ..models.api_models import RequestContext
 
+# Python 3.10+ 才支持 dataclass(slots=True)
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
-@dataclass
+
+@dataclass(**_DATACLASS_SLOTS)
 class RequestMetrics:
-    """单次请求指标"""
+    """单次请求指标（历史窗口中最多保留max_history个实例，使用__slots__省去每个实例的__dict__）"""
     request_id: str
     model: str
     start_time: float
@@ -27,6 +34,8 @@ class RequestMetrics:
     user_id: Optional[str] = None
     stream: bool = False
     request_type: str = "chat"  # chat, embedding
+    cache_hit: Optional[bool] = None  # None表示请求不适用缓存
+    deduplicated: bool = False  # 是否复用了进行中的相同请求的结果
     
     @property
     def duration(self) -> float:
@@ -41,215 +50,365 @@ class RequestMetrics:
         return self.end_time is not None
 
 
+# 聚合计数器分片数，不同请求落在不同分片上，互不争用同一把锁
+METRICS_SHARDS = 16
+# 小时统计环形缓冲的槽位数（保留7天）
+HOURLY_SLOTS = 168
+# 已完成请求先进入待合并缓冲，累计到该条数（或读取统计时）再批量计入聚合统计
+METRICS_FLUSH_BATCH = 256
+
+
+# 最近一次查询的 (UTC小时序号, 本地时区偏移秒数)，同一小时内的请求无需再调用localtime
+_utc_offset_cache = (-1, 0)
+
+
+def _hour_index(timestamp: float) -> int:
+    """时间戳对应的本地绝对小时序号"""
+    global _utc_offset_cache
+    utc_hour = int(timestamp // 3600)
+    cached_hour, offset = _utc_offset_cache
+    if cached_hour != utc_hour:
+        offset = time.localtime(timestamp).tm_gmtoff
+        _utc_offset_cache = (utc_hour, offset)
+    return int((timestamp + offset) // 3600)
+
+
+def _new_hour_stats() -> Dict:
+    return {
+        'requests': 0,
+        'tokens': 0,
+        'duration': 0.0,
+        'errors': 0
+    }
+
+
+def _new_model_stats() -> Dict:
+    return {
+        'requests': 0,
+        'tokens': 0,
+        'total_duration': 0.0,
+        'success_count': 0,
+        'error_count': 0
+    }
+
+
+class _MetricsShard:
+    """单个分片的活跃请求和聚合计数（由分片内的锁保护）"""
+
+    __slots__ = (
+        "lock", "active_requests", "total_requests", "total_tokens", "total_duration",
+        "success_count", "model_usage", "cache_hits", "cache_misses", "deduplicated",
+        "hourly_ring", "hourly_epoch"
+    )
+
+    def __init__(self, lock):
+        self.lock = lock
+        self.active_requests: Dict[str, RequestMetrics] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        self.active_requests.clear()
+        self.total_requests = 0
+        self.total_tokens = 0
+        self.total_duration = 0.0
+        self.success_count = 0
+        self.model_usage: Counter = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.deduplicated = 0
+        # 按小时统计的环形缓冲，hourly_epoch记录每个槽位当前对应的小时序号
+        self.hourly_ring: List[Dict] = [_new_hour_stats() for _ in range(HOURLY_SLOTS)]
+        self.hourly_epoch: List[int] = [-1] * HOURLY_SLOTS
+
+
 class MetricsCollector:
-    """指标收集器"""
+    """指标收集器
+
+    活跃请求和聚合计数按request_id分散到多个分片，各自加锁；
+    已完成的请求先追加到待合并缓冲，批量计入聚合统计（每个分片只加一次锁），
+    读取统计时先合并缓冲，再合并所有分片。
+
+    默认所有调用都在同一个事件循环线程中执行，天然串行，锁为空操作；
+    ``threaded=True`` 时使用真实的线程锁，供多线程调用的场景使用。
+    """
     
-    def __init__(self, max_history: int = 10000):
+    def __init__(self, max_history: int = 10000, threaded: bool = False):
         self.max_history = max_history
-        self._lock = Lock()
+        new_lock = Lock if threaded else nullcontext
+        self._shards = tuple(_MetricsShard(new_lock()) for _ in range(METRICS_SHARDS))
         
-        # 活跃请求
-        self._active_requests: Dict[str, RequestMetrics] = {}
-        
-        # 已完成请求历史（使用deque限制大小）
+        # 已完成请求历史（使用deque限制大小）及其按模型的聚合，随历史窗口增量维护
+        self._history_lock = new_lock()
         self._completed_requests: deque = deque(maxlen=max_history)
-        
-        # 聚合统计
-        self._total_requests = 0
-        self._total_tokens = 0
-        self._total_duration = 0.0
-        self._success_count = 0
-        self._model_usage: Dict[str, int] = defaultdict(int)
-        self._hourly_stats: Dict[str, Dict] = defaultdict(lambda: {
-            'requests': 0,
-            'tokens': 0,
-            'duration': 0.0,
-            'errors': 0
-        })
+        self._model_stats: Dict[str, Dict] = {}
+        # 待计入聚合统计的已完成请求（deque的append/popleft本身是线程安全的）
+        self._pending: deque = deque()
+        # 数据版本号，每次开始/完成请求或重置时递增；与实例标识一起生成统计快照的ETag
+        self._version = 0
+        self._instance_tag = secrets.token_hex(4)
+
+    def snapshot_tag(self) -> str:
+        """当前统计数据的标识：数据或所在小时变化时改变，可直接用作ETag"""
+        return f"{self._instance_tag}-{self._version}-{_hour_index(time.time())}"
+
+    def _shard(self, request_id: str) -> _MetricsShard:
+        """按request_id选择分片"""
+        return self._shards[hash(request_id) % METRICS_SHARDS]
     
     def start_request(self, context: RequestContext) -> RequestMetrics:
         """开始记录请求"""
-        with self._lock:
-            metrics = RequestMetrics(
-                request_id=context.request_id,
-                model=context.model,
-                start_time=context.start_time,
-                user_id=context.user_id,
-                stream=context.stream,
-                request_type=context.request_type
-            )
-            self._active_requests[context.request_id] = metrics
-            return metrics
+        metrics = RequestMetrics(
+            request_id=context.request_id,
+            model=context.model,
+            start_time=context.start_time,
+            user_id=context.user_id,
+            stream=context.stream,
+            request_type=context.request_type
+        )
+        shard = self._shard(context.request_id)
+        with shard.lock:
+            shard.active_requests[context.request_id] = metrics
+        self._version += 1
+        return metrics
     
     def complete_request(self, request_id: str, success: bool = True,
                         error_message: Optional[str] = None,
                         prompt_tokens: int = 0,
                         completion_tokens: int = 0,
-                        total_tokens: Optional[int] = None) -> Optional[RequestMetrics]:
+                        total_tokens: Optional[int] = None,
+                        cache_hit: Optional[bool] = None,
+                        deduplicated: bool = False) -> Optional[RequestMetrics]:
         """完成请求记录"""
-        with self._lock:
-            if request_id not in self._active_requests:
-                return None
-            
-            metrics = self._active_requests.pop(request_id)
-            metrics.end_time = time.time()
-            metrics.success = success
-            metrics.error_message = error_message
-            metrics.prompt_tokens = prompt_tokens
-            metrics.completion_tokens = completion_tokens
-            # 使用提供的total_tokens，否则计算出来
-            metrics.total_tokens = total_tokens if total_tokens is not None else (prompt_tokens + completion_tokens)
-            
-            # 添加到历史记录
-            self._completed_requests.append(metrics)
-            
-            # 更新聚合统计
-            self._update_aggregated_stats(metrics)
-            
-            return metrics
+        shard = self._shard(request_id)
+        with shard.lock:
+            metrics = shard.active_requests.pop(request_id, None)
+        if metrics is None:
+            return None
+        self._version += 1
+        
+        metrics.end_time = time.time()
+        metrics.success = success
+        metrics.error_message = error_message
+        metrics.prompt_tokens = prompt_tokens
+        metrics.completion_tokens = completion_tokens
+        # 使用提供的total_tokens，否则计算出来
+        metrics.total_tokens = total_tokens if total_tokens is not None else (prompt_tokens + completion_tokens)
+        metrics.cache_hit = cache_hit
+        metrics.deduplicated = deduplicated
+
+        # 进入待合并缓冲，攒够一批再更新聚合统计和历史记录
+        self._pending.append(metrics)
+        if len(self._pending) >= METRICS_FLUSH_BATCH:
+            self._flush_pending()
+        return metrics
+
+    def _flush_pending(self) -> None:
+        """将缓冲中的已完成请求批量计入分片聚合统计和历史记录"""
+        pending = self._pending
+        batch = []
+        while pending:
+            try:
+                batch.append(pending.popleft())
+            except IndexError:  # 其他线程已取走
+                break
+        if not batch:
+            return
+
+        by_shard: Dict[int, List[RequestMetrics]] = {}
+        for metrics in batch:
+            by_shard.setdefault(hash(metrics.request_id) % METRICS_SHARDS, []).append(metrics)
+        for shard_index, shard_batch in by_shard.items():
+            shard = self._shards[shard_index]
+            with shard.lock:
+                for metrics in shard_batch:
+                    self._update_aggregated_stats(shard, metrics)
+
+        self._record_history(batch)
+
+    def _record_history(self, batch: List[RequestMetrics]) -> None:
+        """追加历史记录，并从模型统计中扣除被挤出窗口的最旧记录"""
+        with self._history_lock:
+            history = self._completed_requests
+            if not history.maxlen:
+                return
+            for metrics in batch:
+                if len(history) == history.maxlen:
+                    self._apply_model_stats(history[0], -1)
+                history.append(metrics)
+                self._apply_model_stats(metrics, 1)
+
+    def _apply_model_stats(self, request: RequestMetrics, sign: int) -> None:
+        """将单条请求计入（sign=1）或移出（sign=-1）模型统计（调用时已持有历史锁）"""
+        stats = self._model_stats.get(request.model)
+        if stats is None:
+            stats = self._model_stats[request.model] = _new_model_stats()
+        stats['requests'] += sign
+        stats['tokens'] += sign * request.total_tokens
+        stats['total_duration'] += sign * request.duration
+        if request.success:
+            stats['success_count'] += sign
+        else:
+            stats['error_count'] += sign
+        if stats['requests'] <= 0:
+            del self._model_stats[request.model]
     
-    def _update_aggregated_stats(self, metrics: RequestMetrics) -> None:
-        """更新聚合统计（调用时已持有锁）"""
-        self._total_requests += 1
-        self._total_tokens += metrics.total_tokens
-        self._total_duration += metrics.duration
+    def _update_aggregated_stats(self, shard: _MetricsShard, metrics: RequestMetrics) -> None:
+        """更新分片的聚合统计（调用时已持有分片锁）"""
+        shard.total_requests += 1
+        shard.total_tokens += metrics.total_tokens
+        shard.total_duration += metrics.duration
         
         if metrics.success:
-            self._success_count += 1
+            shard.success_count += 1
         
-        self._model_usage[metrics.model] += 1
+        shard.model_usage[metrics.model] += 1
+
+        if metrics.cache_hit is True:
+            shard.cache_hits += 1
+        elif metrics.cache_hit is False:
+            shard.cache_misses += 1
+        if metrics.deduplicated:
+            shard.deduplicated += 1
         
-        # 按小时统计
-        hour_key = time.strftime('%Y-%m-%d-%H', time.localtime(metrics.start_time))
-        hour_stats = self._hourly_stats[hour_key]
+        # 按小时统计（槽位属于更早的小时时先清空，超出保留范围的旧记录不计入）
+        hour_index = _hour_index(metrics.start_time)
+        slot = hour_index % HOURLY_SLOTS
+        slot_hour = shard.hourly_epoch[slot]
+        if slot_hour > hour_index:
+            return
+        if slot_hour != hour_index:
+            shard.hourly_epoch[slot] = hour_index
+            shard.hourly_ring[slot] = _new_hour_stats()
+        hour_stats = shard.hourly_ring[slot]
         hour_stats['requests'] += 1
         hour_stats['tokens'] += metrics.total_tokens
         hour_stats['duration'] += metrics.duration
         if not metrics.success:
             hour_stats['errors'] += 1
+
+    def _merged_hour_stats(self, hour_indexes: List[int]) -> List[Dict]:
+        """合并所有分片中指定小时的统计"""
+        merged = [_new_hour_stats() for _ in hour_indexes]
+        for shard in self._shards:
+            with shard.lock:
+                for hour_index, target in zip(hour_indexes, merged):
+                    slot = hour_index % HOURLY_SLOTS
+                    if shard.hourly_epoch[slot] != hour_index:
+                        continue
+                    for key, value in shard.hourly_ring[slot].items():
+                        target[key] += value
+        return merged
     
     def get_current_stats(self) -> Dict:
-        """获取当前统计数据"""
-        with self._lock:
-            if self._total_requests == 0:
-                return {
-                    'total_requests': 0,
-                    'total_tokens': 0,
-                    'average_latency': 0.0,
-                    'success_rate': 1.0,
-                    'active_requests': 0,
-                    'models_used': {},
-                    'requests_per_hour': 0,
-                    'tokens_per_hour': 0
-                }
-            
-            current_hour = time.strftime('%Y-%m-%d-%H')
-            hour_stats = self._hourly_stats.get(current_hour, {'requests': 0, 'tokens': 0})
-            
+        """获取当前统计数据（合并所有分片）"""
+        self._flush_pending()
+        total_requests = total_tokens = success_count = active_requests = 0
+        cache_hits = cache_misses = deduplicated = 0
+        total_duration = 0.0
+        model_usage: Counter = Counter()
+        for shard in self._shards:
+            with shard.lock:
+                total_requests += shard.total_requests
+                total_tokens += shard.total_tokens
+                total_duration += shard.total_duration
+                success_count += shard.success_count
+                active_requests += len(shard.active_requests)
+                model_usage += shard.model_usage
+                cache_hits += shard.cache_hits
+                cache_misses += shard.cache_misses
+                deduplicated += shard.deduplicated
+
+        if total_requests == 0:
             return {
-                'total_requests': self._total_requests,
-                'total_tokens': self._total_tokens,
-                'average_latency': self._total_duration / self._total_requests if self._total_requests > 0 else 0.0,
-                'success_rate': self._success_count / self._total_requests if self._total_requests > 0 else 1.0,
-                'active_requests': len(self._active_requests),
-                'models_used': dict(self._model_usage),
-                'requests_per_hour': hour_stats['requests'],
-                'tokens_per_hour': hour_stats['tokens']
+                'total_requests': 0,
+                'total_tokens': 0,
+                'average_latency': 0.0,
+                'success_rate': 1.0,
+                'active_requests': 0,
+                'models_used': {},
+                'requests_per_hour': 0,
+                'tokens_per_hour': 0,
+                'cache_hits': 0,
+                'cache_misses': 0,
+                'deduplicated': 0
             }
+        
+        hour_stats = self._merged_hour_stats([_hour_index(time.time())])[0]
+        
+        return {
+            'total_requests': total_requests,
+            'total_tokens': total_tokens,
+            'average_latency': total_duration / total_requests,
+            'success_rate': success_count / total_requests,
+            'active_requests': active_requests,
+            'models_used': dict(model_usage),
+            'requests_per_hour': hour_stats['requests'],
+            'tokens_per_hour': hour_stats['tokens'],
+            'cache_hits': cache_hits,
+            'cache_misses': cache_misses,
+            'deduplicated': deduplicated
+        }
     
     def get_recent_requests(self, limit: int = 100) -> List[RequestMetrics]:
         """获取最近的请求记录"""
-        with self._lock:
-            # 返回最近的请求（从新到旧）
-            recent_requests = list(self._completed_requests)[-limit:]
-            recent_requests.reverse()
-            return recent_requests
+        self._flush_pending()
+        # 返回最近的请求（从新到旧）
+        recent_requests = list(self._completed_requests)[-limit:]
+        recent_requests.reverse()
+        return recent_requests
     
     def get_model_stats(self) -> Dict[str, Dict]:
-        """获取按模型分组的统计"""
-        with self._lock:
-            model_stats = {}
-            
-            for request in self._completed_requests:
-                model = request.model
-                if model not in model_stats:
-                    model_stats[model] = {
-                        'requests': 0,
-                        'tokens': 0,
-                        'total_duration': 0.0,
-                        'success_count': 0,
-                        'error_count': 0
-                    }
-                
-                stats = model_stats[model]
-                stats['requests'] += 1
-                stats['tokens'] += request.total_tokens
-                stats['total_duration'] += request.duration
-                
-                if request.success:
-                    stats['success_count'] += 1
-                else:
-                    stats['error_count'] += 1
-            
-            # 计算平均值
-            for model, stats in model_stats.items():
-                if stats['requests'] > 0:
-                    stats['average_latency'] = stats['total_duration'] / stats['requests']
-                    stats['success_rate'] = stats['success_count'] / stats['requests']
-                else:
-                    stats['average_latency'] = 0.0
-                    stats['success_rate'] = 1.0
-            
-            return model_stats
-    
-    def get_hourly_trends(self, hours: int = 24) -> Dict[str, List]:
-        """获取小时级趋势数据"""
-        with self._lock:
-            current_time = time.time()
-            trends = {
-                'hours': [],
-                'requests': [],
-                'tokens': [],
-                'latency': [],
-                'errors': []
+        """获取按模型分组的统计（基于历史窗口内的请求，读取时只计算平均值）"""
+        self._flush_pending()
+        with self._history_lock:
+            return {
+                model: {
+                    **stats,
+                    'average_latency': stats['total_duration'] / stats['requests'],
+                    'success_rate': stats['success_count'] / stats['requests']
+                }
+                for model, stats in self._model_stats.items()
             }
+
+    def get_hourly_trends(self, hours: int = 24) -> Dict[str, List]:
+        """获取小时级趋势数据（从旧到新）"""
+        self._flush_pending()
+        current_hour = _hour_index(time.time())
+        hour_indexes = list(range(current_hour - hours + 1, current_hour + 1))
+        trends = {
+            'hours': [],
+            'requests': [],
+            'tokens': [],
+            'latency': [],
+            'errors': []
+        }
+        
+        for hour_index, hour_stats in zip(hour_indexes, self._merged_hour_stats(hour_indexes)):
+            trends['hours'].append(f"{hour_index % 24:02d}:00")
+            trends['requests'].append(hour_stats['requests'])
+            trends['tokens'].append(hour_stats['tokens'])
             
-            for i in range(hours):
-                hour_time = current_time - (i * 3600)
-                hour_key = time.strftime('%Y-%m-%d-%H', time.localtime(hour_time))
-                hour_stats = self._hourly_stats.get(hour_key, {
-                    'requests': 0,
-                    'tokens': 0,
-                    'duration': 0.0,
-                    'errors': 0
-                })
-                
-                trends['hours'].insert(0, time.strftime('%H:00', time.localtime(hour_time)))
-                trends['requests'].insert(0, hour_stats['requests'])
-                trends['tokens'].insert(0, hour_stats['tokens'])
-                
-                # 计算平均延迟
-                if hour_stats['requests'] > 0:
-                    avg_latency = hour_stats['duration'] / hour_stats['requests']
-                else:
-                    avg_latency = 0.0
-                trends['latency'].insert(0, avg_latency)
-                trends['errors'].insert(0, hour_stats['errors'])
-            
-            return trends
-    
+            # 计算平均延迟
+            if hour_stats['requests'] > 0:
+                avg_latency = hour_stats['duration'] / hour_stats['requests']
+            else:
+                avg_latency = 0.0
+            trends['latency'].append(avg_latency)
+            trends['errors'].append(hour_stats['errors'])
+        
+        return trends
+
     def reset_stats(self) -> None:
         """重置所有统计数据"""
-        with self._lock:
-            self._active_requests.clear()
+        self._version += 1
+        self._pending.clear()
+        for shard in self._shards:
+            with shard.lock:
+                shard.reset()
+        with self._history_lock:
             self._completed_requests.clear()
-            self._total_requests = 0
-            self._total_tokens = 0
-            self._total_duration = 0.0
-            self._success_count = 0
-            self._model_usage.clear()
-            self._hourly_stats.clear()
+            self._model_stats.clear()
 
 
 # 全局指标收集器实例
-metrics_collector = MetricsCollector()
\ No newline at end of file
+metrics_collector = MetricsCollector(threaded=settings.metrics_thread_safe)
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+时间戳缓存模块
+由后台任务定时刷新秒级时间戳，避免高频场景下重复调用time.time()
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+# 时间戳刷新间隔（秒）
+CLOCK_TICK_INTERVAL = 0.25
+
+_now = int(time.time())
+_tick_task: Optional[asyncio.Task] = None
+
+
+def now_seconds() -> int:
+    """获取当前秒级时间戳，后台任务未运行时直接读取系统时间"""
+    if _tick_task is None:
+        return int(time.time())
+    return _now
+
+
+async def _tick() -> None:
+    """后台定时刷新时间戳"""
+    global _now
+    while True:
+        _now = int(time.time())
+        await asyncio.sleep(CLOCK_TICK_INTERVAL)
+
+
+def start_clock() -> None:
+    """启动时间戳刷新任务（需在事件循环中调用）"""
+    global _now, _tick_task
+    if _tick_task is None:
+        _now = int(time.time())
+        _tick_task = asyncio.get_running_loop().create_task(_tick())
+
+
+async def stop_clock() -> None:
+    """停止时间戳刷新任务"""
+    global _tick_task
+    task, _tick_task = _tick_task, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -3,15 +3,49 @@
 提供通用的辅助函数
 """
 
+import array
+import base64
+import json
+import os
+import re
+import secrets
+import sys
+import threading
 import time
-import uuid
-from typing import Any, Dict, Optional
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import repeat
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from fastapi import HTTPException, Request
 
+try:
+    import tiktoken
+except ImportError:  # tiktoken为可选依赖，缺失时token统计回退到估算
+    tiktoken = None
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，缺失时用正则统计中文字符、嵌入向量保持浮点列表
+    np = None
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，缺失时用标准库json解析请求体
+    orjson = None
+
+TIKTOKEN_AVAILABLE = tiktoken is not None
+
+
+def parse_json_body(body: bytes) -> Any:
+    """解析请求体JSON，优先使用orjson直接解析bytes（无需先解码为str）"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
 
 def generate_request_id() -> str:
-    """生成唯一请求ID"""
-    return str(uuid.uuid4())[:8]
+    """生成唯一请求ID（8位十六进制）"""
+    return secrets.token_hex(4)
 
 
 def get_current_timestamp() -> int:
@@ -21,20 +55,27 @@ def get_current_timestamp() -> int:
 
 def extract_user_id_from_request(request: Request) -> Optional[str]:
     """从请求中提取用户ID"""
+    # 一次遍历原始header，同时取出Authorization和自定义用户ID
+    authorization = user_id_header = None
+    for name, value in request.headers.raw:
+        if name == b"authorization":
+            authorization = value
+        elif name == b"x-user-id":
+            user_id_header = value
+
     # 尝试从Authorization header中提取
-    auth_header = request.headers.get("authorization")
-    if auth_header and auth_header.startswith("Bearer "):
+    if authorization and authorization.startswith(b"Bearer "):
         # 这里可以根据实际需求解析token获取用户ID
-        # 简单起见，直接返回token的一部分作为用户ID
-        token = auth_header[7:]  # 移除"Bearer "
-        return token[:16] if len(token) > 16 else token
+        # 简单起见，直接返回token的一部分作为用户ID（只解码前16个字节）
+        return authorization[7:23].decode("latin-1")
     
     # 尝试从自定义header中提取
-    user_id = request.headers.get("x-user-id")
-    if user_id:
-        return user_id
+    if user_id_header:
+        return user_id_header.decode("latin-1")
     
-    # 尝试从查询参数中提取
+    # 尝试从查询参数中提取（仅在header都缺失时才解析查询字符串）
+    if not request.scope.get("query_string"):
+        return None
     user_id = request.query_params.get("user_id")
     if user_id:
         return user_id
@@ -42,6 +83,10 @@ def extract_user_id_from_request(request: Request) -> Optional[str]:
     return None
 
 
+# 模型名称中不允许出现的字符
+_INVALID_MODEL_CHARS = frozenset(" \n\r\t")
+
+
 def validate_model_name(model: str) -> bool:
     """验证模型名称是否有效"""
     if not model or not isinstance(model, str):
@@ -51,13 +96,8 @@ def validate_model_name(model: str) -> bool:
     if len(model) < 1 or len(model) > 100:
         return False
     
-    # 不允许包含特殊字符
-    invalid_chars = [" ", "\n", "\r", "\t"]
-    for char in invalid_chars:
-        if char in model:
-            return False
-    
-    return True
+    # 不允许包含特殊字符（一次遍历完成判断）
+    return _INVALID_MODEL_CHARS.isdisjoint(model)
 
 
 def create_error_response(message: str, error_type: str = "error", 
@@ -75,6 +115,13 @@ def create_error_response(message: str, error_type: str = "error",
     )
 
 
+# 敏感字段及其取值，如 api_key=sk-xxx、"password": "xxx"
+_SENSITIVE_PATTERN = re.compile(
+    r"""\b(api[_-]?key|password|token|secret|key)\b(["']?\s*[:=]\s*["']?)([A-Za-z0-9_\-.]+)""",
+    re.IGNORECASE
+)
+
+
 def sanitize_log_content(content: str, max_length: int = 1000) -> str:
     """清理日志内容，限制长度并移除敏感信息"""
     if not content:
@@ -84,19 +131,8 @@ def sanitize_log_content(content: str, max_length: int = 1000) -> str:
     if len(content) > max_length:
         content = content[:max_length] + "..."
     
-    # 这里可以添加更多的敏感信息过滤逻辑
-    # 例如移除API密钥、密码等
-    sensitive_patterns = [
-        "api_key", "password", "token", "secret", "key"
-    ]
-    
-    # 简单的敏感信息掩码（实际项目中应该使用更复杂的正则表达式）
-    for pattern in sensitive_patterns:
-        if pattern in content.lower():
-            # 这里只是示例，实际应该用正则表达式精确匹配和替换
-            pass
-    
-    return content
+    # 一次正则替换掩码API密钥、密码等敏感字段的值（保留字段名和分隔符）
+    return _SENSITIVE_PATTERN.sub(r"\1\2***", content)
 
 
 def format_duration(seconds: float) -> str:
@@ -106,19 +142,17 @@ def format_duration(seconds: float) -> str:
     elif seconds < 60:
         return f"{seconds:.2f}s"
     elif seconds < 3600:
-        minutes = int(seconds // 60)
-        remaining_seconds = seconds % 60
-        return f"{minutes}m {remaining_seconds:.1f}s"
+        minutes, remaining_seconds = divmod(seconds, 60)
+        return f"{int(minutes)}m {remaining_seconds:.1f}s"
     else:
-        hours = int(seconds // 3600)
-        remaining_minutes = int((seconds % 3600) // 60)
+        # 小时以上只显示到分钟，先取整再用整数运算
+        hours, remaining_minutes = divmod(int(seconds) // 60, 60)
         return f"{hours}h {remaining_minutes}m"
 
 
 def safe_json_serialize(obj: Any) -> Dict[str, Any]:
     """安全的JSON序列化，处理不可序列化的对象"""
     try:
-        import json
         # 尝试序列化，如果失败则转换为字符串
         json.dumps(obj)
         return obj
@@ -129,6 +163,28 @@ def safe_json_serialize(obj: Any) -> Dict[str, Any]:
             return {"value": str(obj), "type": type(obj).__name__}
 
 
+# 中文字符范围（CJK统一汉字）
+_CJK_LO, _CJK_HI = 0x4E00, 0x9FFF
+_CJK_RUN_PATTERN = re.compile("[\u4e00-\u9fff]+")
+# 短文本直接用正则统计，避免numpy数组转换的固定开销
+_NUMPY_MIN_CHARS = 64
+
+
+def _count_chinese_chars(text: str) -> int:
+    """统计中文字符数，逐字符比较在C层完成"""
+    if text.isascii():
+        return 0
+    if np is not None and len(text) >= _NUMPY_MIN_CHARS:
+        try:
+            codepoints = np.frombuffer(text.encode("utf-32-le"), dtype="<u4")
+        except UnicodeEncodeError:
+            # 含孤立代理字符时无法编码，回退到正则统计
+            codepoints = None
+        if codepoints is not None:
+            return int(np.count_nonzero((codepoints >= _CJK_LO) & (codepoints <= _CJK_HI)))
+    return sum(map(len, _CJK_RUN_PATTERN.findall(text)))
+
+
 def calculate_tokens_estimate(text: str) -> int:
     """估算文本的token数量"""
     if not text:
@@ -139,7 +195,7 @@ def calculate_tokens_estimate(text: str) -> int:
     # 中文：大约1.5个字符 = 1个token
     
     # 统计中文字符数
-    chinese_chars = sum(1 for char in text if '\u4e00' <= char <= '\u9fff')
+    chinese_chars = _count_chinese_chars(text)
     
     # 统计总字符数
     total_chars = len(text)
@@ -153,9 +209,190 @@ def calculate_tokens_estimate(text: str) -> int:
     return max(1, int(estimated_tokens))
 
 
+# 按编码名称缓存已加载的tiktoken编码（编码种类有限，不随客户端传入的模型名称增长）
+_TOKEN_ENCODINGS: Dict[str, Any] = {}
+# 编码表加载失败的时间，间隔该秒数后才重试（避免离线时每次统计都重新下载，又不永久禁用）
+_TOKEN_ENCODING_FAILURES: Dict[str, float] = {}
+TOKEN_ENCODING_RETRY_INTERVAL = 60.0
+
+# gpt2/r50k_base词表大小，不小于该值的token id不可能来自这两种编码
+GPT2_VOCAB_SIZE = 50257
+
+# 解码token数组时依次尝试的编码（cl100k_base优先：现代模型的常见token id大多也小于gpt2词表大小）
+TOKEN_DECODE_ENCODINGS = ("cl100k_base", "gpt2", "r50k_base", "p50k_base")
+# 已排除gpt2/r50k_base时的尝试顺序
+LARGE_VOCAB_DECODE_ENCODINGS = ("cl100k_base", "p50k_base")
+
+
+def get_token_encoding(name: str) -> Any:
+    """按名称获取并缓存tiktoken编码，tiktoken未安装或编码表无法加载时返回None（加载失败不永久缓存）"""
+    encoding = _TOKEN_ENCODINGS.get(name)
+    if encoding is not None or tiktoken is None:
+        return encoding
+    failed_at = _TOKEN_ENCODING_FAILURES.get(name)
+    if failed_at is not None and time.monotonic() - failed_at < TOKEN_ENCODING_RETRY_INTERVAL:
+        return None
+    try:
+        encoding = _TOKEN_ENCODINGS[name] = tiktoken.get_encoding(name)
+    except Exception:
+        _TOKEN_ENCODING_FAILURES[name] = time.monotonic()
+        return None
+    _TOKEN_ENCODING_FAILURES.pop(name, None)
+    return encoding
+
+
+def is_token_array(value: Any) -> bool:
+    """判断是否为token id数组（整数列表），逐元素检查在C层完成"""
+    return isinstance(value, list) and all(map(isinstance, value, repeat(int)))
+
+
+def token_decode_order(tokens: Sequence[int]) -> Tuple[str, ...]:
+    """返回解码时的尝试顺序：始终优先cl100k_base，token id范围仅用于跳过不可能的编码"""
+    if max(tokens) < GPT2_VOCAB_SIZE:
+        return TOKEN_DECODE_ENCODINGS
+    # 超出gpt2词表的id只可能来自更大的词表
+    return LARGE_VOCAB_DECODE_ENCODINGS
+
+
+# 解码结果缓存条目数，以及允许缓存的最大token数（过长的数组不缓存，限制内存占用）
+TOKEN_DECODE_CACHE_SIZE = 4096
+TOKEN_DECODE_CACHE_MAX_TOKENS = 8192
+
+
+def _decode_tokens(tokens: Sequence[int]) -> Optional[Tuple[str, str]]:
+    """按尝试顺序逐个编码解码，返回 (编码名称, 文本)，全部失败时返回None"""
+    for encoder_name in token_decode_order(tokens):
+        encoding = get_token_encoding(encoder_name)
+        if encoding is None:
+            continue
+        try:
+            decoded_text = encoding.decode(tokens)
+        except Exception:
+            continue
+        if decoded_text and decoded_text.strip():
+            return encoder_name, decoded_text
+    return None
+
+
+# 解码结果LRU缓存（只缓存解码成功的结果）；解码在线程池中执行，缓存读写由锁保护
+_TOKEN_DECODE_CACHE: "OrderedDict[Tuple[int, ...], Tuple[str, str]]" = OrderedDict()
+_TOKEN_DECODE_CACHE_LOCK = threading.Lock()
+
+
+def _get_cached_decode(key: Tuple[int, ...]) -> Optional[Tuple[str, str]]:
+    """读取已缓存的解码结果，命中时标记为最近使用"""
+    with _TOKEN_DECODE_CACHE_LOCK:
+        result = _TOKEN_DECODE_CACHE.get(key)
+        if result is not None:
+            _TOKEN_DECODE_CACHE.move_to_end(key)
+        return result
+
+
+def _cache_decode(key: Tuple[int, ...], result: Tuple[str, str]) -> None:
+    """写入解码结果，超出容量时淘汰最久未使用的条目"""
+    with _TOKEN_DECODE_CACHE_LOCK:
+        _TOKEN_DECODE_CACHE[key] = result
+        _TOKEN_DECODE_CACHE.move_to_end(key)
+        while len(_TOKEN_DECODE_CACHE) > TOKEN_DECODE_CACHE_SIZE:
+            _TOKEN_DECODE_CACHE.popitem(last=False)
+
+
+def decode_token_array(tokens: List[int]) -> Optional[Tuple[str, str]]:
+    """
+    将非空token数组解码为文本，返回 (编码名称, 文本)
+    重复出现的token数组（系统提示、few-shot示例等）直接命中缓存，无需再次解码
+    """
+    if len(tokens) > TOKEN_DECODE_CACHE_MAX_TOKENS:
+        return _decode_tokens(tokens)
+    key = tuple(tokens)
+    result = _get_cached_decode(key)
+    if result is None:
+        result = _decode_tokens(key)
+        if result is not None:
+            _cache_decode(key, result)
+    return result
+
+
+# 未命中缓存的token数组不少于该条数时才批量解码（线程池的创建开销在小批量时得不偿失）
+TOKEN_DECODE_BATCH_MIN = 8
+TOKEN_DECODE_BATCH_THREADS = min(32, os.cpu_count() or 1)
+
+
+def decode_token_arrays(arrays: List[List[int]]) -> List[Optional[Tuple[str, str]]]:
+    """
+    批量解码多个非空token数组，返回与输入一一对应的 (编码名称, 文本) 或None
+    先查解码缓存，未命中的数组用首选编码（cl100k_base）一次decode_batch解码并写入缓存；
+    批量解码失败或结果为空白的条目再逐个按尝试顺序解码
+    """
+    results: List[Optional[Tuple[str, str]]] = [None] * len(arrays)
+    misses: List[int] = []
+    for index, tokens in enumerate(arrays):
+        if len(tokens) <= TOKEN_DECODE_CACHE_MAX_TOKENS:
+            results[index] = _get_cached_decode(tuple(tokens))
+        if results[index] is None:
+            misses.append(index)
+
+    encoder_name = TOKEN_DECODE_ENCODINGS[0]
+    encoding = get_token_encoding(encoder_name) if len(misses) >= TOKEN_DECODE_BATCH_MIN else None
+    if encoding is not None:
+        try:
+            texts = encoding.decode_batch(
+                [arrays[index] for index in misses], num_threads=TOKEN_DECODE_BATCH_THREADS
+            )
+        except Exception:
+            texts = []
+        for index, text in zip(misses, texts):
+            if text and text.strip():
+                results[index] = (encoder_name, text)
+                if len(arrays[index]) <= TOKEN_DECODE_CACHE_MAX_TOKENS:
+                    _cache_decode(tuple(arrays[index]), results[index])
+
+    for index in misses:
+        if results[index] is None:
+            results[index] = decode_token_array(arrays[index])
+    return results
+
+
+@lru_cache(maxsize=256)
+def token_encoding_name(model: str) -> str:
+    """模型对应的tiktoken编码名称，非OpenAI模型使用cl100k_base近似（只查表，不加载编码）"""
+    if tiktoken is not None:
+        try:
+            return tiktoken.encoding_name_for_model(model.rsplit("/", 1)[-1])
+        except KeyError:
+            pass
+    return "cl100k_base"
+
+
+def count_tokens(text: str, model: str) -> int:
+    """统计文本的token数量，tiktoken不可用时回退到估算"""
+    if not text:
+        return 0
+    encoder = get_token_encoding(token_encoding_name(model))
+    if encoder is None:
+        return calculate_tokens_estimate(text)
+    return len(encoder.encode_ordinary(text))
+
+
 def truncate_text(text: str, max_length: int = 100, suffix: str = "...") -> str:
     """截断文本并添加后缀"""
     if not text or len(text) <= max_length:
         return text
     
-    return text[:max_length - len(suffix)] + suffix
\ No newline at end of file
+    return text[:max_length - len(suffix)] + suffix
+
+def floats_to_array(vector: List[float]) -> Any:
+    """将浮点列表转为float32数组（约为列表内存的1/8），未安装numpy时原样返回"""
+    if np is None:
+        return vector
+    return np.asarray(vector, dtype=np.float32)
+
+
+def floats_to_base64(vector: Any) -> str:
+    """将浮点向量打包为little-endian float32并进行base64编码（与OpenAI格式一致）"""
+    if np is not None and isinstance(vector, np.ndarray):
+        return base64.b64encode(vector.astype("<f4", copy=False).tobytes()).decode("ascii")
+    packed = array.array("f", vector)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode("ascii")
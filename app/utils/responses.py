@@ -0,0 +1,69 @@
+"""
+响应类模块
+基于orjson的JSON响应，加速大体积响应（如embeddings）的序列化
+"""
+
+import json
+from typing import Any, AsyncIterator
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，缺失时回退到标准库json
+    orjson = None
+
+
+def _json_default(value: Any) -> Any:
+    """标准库json回退时序列化numpy数组"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ORJSONResponse(JSONResponse):
+    """使用orjson序列化的JSON响应"""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is None:
+            return json.dumps(
+                content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_json_default
+            ).encode("utf-8")
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+# 流式响应结束标记
+SSE_DONE = b"data: [DONE]\n\n"
+
+
+def _dumps(payload: Any) -> bytes:
+    """序列化为紧凑JSON bytes"""
+    if orjson is None:
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def sse_event(payload: Any) -> bytes:
+    """将数据编码为一条SSE事件（bytes，StreamingResponse无需再次编码）"""
+    return b"data: " + _dumps(payload) + b"\n\n"
+
+
+# 流式嵌入响应每个分块包含的嵌入条数
+EMBEDDING_JSON_CHUNK_SIZE = 64
+
+
+async def iter_embedding_json(response: Any) -> AsyncIterator[bytes]:
+    """
+    分块序列化嵌入响应，供StreamingResponse边序列化边发送
+    避免先model_dump出完整字典、再整体序列化造成的两份向量数据副本；
+    异步生成器由StreamingResponse直接在事件循环上迭代，同步迭代器则每块都要经过一次线程池
+    """
+    data = response.data
+    yield b'{"object":"list","data":['
+    for start in range(0, len(data), EMBEDDING_JSON_CHUNK_SIZE):
+        body = b",".join([
+            _dumps({"object": item.object, "embedding": item.embedding, "index": item.index})
+            for item in data[start:start + EMBEDDING_JSON_CHUNK_SIZE]
+        ])
+        yield b"," + body if start else body
+    yield b'],"model":' + _dumps(response.model) + b',"usage":' + _dumps(response.usage.model_dump()) + b"}"
@@ -9,26 +9,45 @@ LLMCallGateway - 专业LLM API网关服务
 - 模块化架构，易于扩展和维护
 """
 
+import asyncio
+import importlib.util
+import inspect
 import time
 from contextlib import asynccontextmanager
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import StreamingResponse, JSONResponse
+from pydantic import ValidationError
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.routing import APIRoute
 import uvicorn
 
 # 导入应用模块
 from app.core.config import settings
-from app.core.logging import system_logger
+from app.core.logging import system_logger, llm_interaction_logger
 from app.models.api_models import (
-    ChatCompletionRequest, ModelList, Model, HealthResponse, MetricsResponse,
-    EmbeddingRequest, EmbeddingResponse
+    ChatCompletionRequest, ModelList, HealthResponse, MetricsResponse,
+    EmbeddingRequest, EmbeddingResponse, CHAT_COMPLETION_REQUEST_ADAPTER
 )
 from app.services.llm_service import llm_service
 from app.services.metrics import metrics_collector
-from app.utils.helpers import extract_user_id_from_request, create_error_response
+from app.utils.helpers import (
+    extract_user_id_from_request, create_error_response, parse_json_body,
+    decode_token_array, decode_token_arrays, is_token_array, TIKTOKEN_AVAILABLE
+)
+from app.utils.responses import ORJSONResponse, iter_embedding_json
+from app.utils.clock import start_clock, stop_clock, now_seconds
+
+# 安装uvloop（uvicorn[standard]自带）时显式使用其C实现的事件循环
+EVENT_LOOP = "uvloop" if importlib.util.find_spec("uvloop") is not None else "asyncio"
+# 安装httptools（uvicorn[standard]自带）时使用其C实现的HTTP解析器
+HTTP_PROTOCOL = "httptools" if importlib.util.find_spec("httptools") is not None else "h11"
+
+# 嵌入结果超过该条数时改为流式序列化响应
+EMBEDDING_STREAM_THRESHOLD = 32
 
 
 @asynccontextmanager
@@ -39,10 +58,15 @@ async def lifespan(app: FastAPI):
     system_logger.info(f"📊 调试模式: {settings.debug}")
     system_logger.info(f"🌐 服务地址: http://{settings.host}:{settings.port}")
     system_logger.info(f"📚 API文档: http://{settings.host}:{settings.port}/docs")
+    llm_interaction_logger.start_background_flush()
+    start_clock()
     
     yield
     
     # 关闭时清理
+    await stop_clock()
+    await llm_service.aclose()
+    await llm_interaction_logger.stop_background_flush()
     system_logger.info(f"⏹️ {settings.app_name} 服务正在关闭...")
 
 
@@ -52,6 +76,7 @@ app = FastAPI(
     description="专业LLM API网关服务 - 统一多模型为OpenAI格式，提供详细的交互日志和性能监控",
     version=settings.app_version,
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs",
     redoc_url="/redoc"
 )
@@ -70,10 +95,10 @@ if settings.enable_cors:
 @app.middleware("http")
 async def request_logging_middleware(request: Request, call_next):
     """请求日志中间件"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
-    # 记录请求信息
-    user_id = extract_user_id_from_request(request)
+    # 记录请求信息（用户ID存入request.state，供路由的get_user_id依赖复用）
+    user_id = request.state.user_id = extract_user_id_from_request(request)
     system_logger.info(
         f"📥 {request.method} {request.url.path} | "
         f"User: {user_id or 'Anonymous'} | "
@@ -84,7 +109,7 @@ async def request_logging_middleware(request: Request, call_next):
     response = await call_next(request)
     
     # 记录响应信息
-    process_time = time.time() - start_time
+    process_time = time.perf_counter() - start_time
     system_logger.info(
         f"📤 {request.method} {request.url.path} | "
         f"Status: {response.status_code} | "
@@ -100,161 +125,261 @@ async def request_logging_middleware(request: Request, call_next):
 
 # === 辅助函数 ===
 
+async def get_user_id(http_request: Request) -> Optional[str]:
+    """路由依赖：获取请求的用户ID（优先复用日志中间件已解析的结果）"""
+    try:
+        return http_request.state.user_id
+    except AttributeError:
+        return extract_user_id_from_request(http_request)
+
+
+class RawRequestRoute(APIRoute):
+    """
+    直接以Request调用端点的路由：跳过FastAPI的参数绑定和依赖求解
+    端点需自行解析请求体；OpenAPI文档仍按路由声明的responses/openapi_extra生成
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Any]:
+        endpoint = self.endpoint
+
+        async def handler(request: Request) -> Response:
+            return await endpoint(request)
+
+        return handler
+
+
+def validation_error_response(details: list) -> Response:
+    """构建422请求格式验证失败响应，details为只含loc/msg/type的错误列表"""
+    return ORJSONResponse(
+        status_code=422,
+        content={
+            "error": {
+                "message": "请求格式验证失败",
+                "type": "validation_error",
+                "details": details
+            }
+        }
+    )
+
+
+def openapi_request_body(model: type, path: str, method: str = "post") -> Dict[str, Any]:
+    """
+    为手动解析请求体的路由生成OpenAPI requestBody描述
+
+    嵌套模型的$ref指向该schema自身的$defs，保证在完整OpenAPI文档中可以解析。
+    """
+    pointer = path.replace("~", "~0").replace("/", "~1")
+    ref_template = (
+        f"#/paths/{pointer}/{method}/requestBody/content/application~1json/schema/$defs/{{model}}"
+    )
+    return {
+        "requestBody": {
+            "content": {"application/json": {"schema": model.model_json_schema(ref_template=ref_template)}},
+            "required": True,
+        }
+    }
+
+
 async def preprocess_embedding_data(raw_data: dict) -> dict:
     """
     预处理embeddings输入数据，支持自动token解码
     """
-    import json
+    input_data = raw_data.get("input")
+    # 字符串、空列表或不含token数组的文本列表无需处理
+    if not isinstance(input_data, list) or not input_data:
+        return raw_data
+    if not isinstance(input_data[0], int) and not any(map(is_token_array, input_data)):
+        return raw_data
+
+    # BPE解码是CPU密集操作，放到线程池执行，避免阻塞事件循环上的其他请求
+    return await asyncio.to_thread(decode_embedding_data, raw_data, input_data)
+
 
+def decode_embedding_data(raw_data: dict, input_data: list) -> dict:
+    """解码embeddings输入中的token数组（在线程池中执行）"""
     processed_data = raw_data.copy()
 
-    if "input" in processed_data:
-        input_data = processed_data["input"]
-
-        # 处理单个token数组
-        if isinstance(input_data, list) and len(input_data) > 0:
-            if all(isinstance(x, int) for x in input_data):
-                # 尝试解码token数组
-                decoded_text = try_decode_tokens(input_data)
-                if decoded_text:
-                    processed_data["input"] = decoded_text
-                    system_logger.info(f"✅ 自动解码token数组为文本: '{decoded_text[:50]}...'")
-                else:
-                    raise ValueError(
-                        f"检测到tokenized数字数组但无法解码。请发送原始文本字符串而不是token数组。"
-                        f"\n正确格式: '原始文本字符串'"
-                        f"\n错误格式: {input_data[:10]}..."
-                    )
-            # 处理包含token数组的列表
-            elif any(isinstance(item, list) and all(isinstance(x, int) for x in item) for item in input_data if isinstance(item, list)):
-                processed_list = []
-                for item in input_data:
-                    if isinstance(item, list) and all(isinstance(x, int) for x in item):
-                        decoded_text = try_decode_tokens(item)
-                        if decoded_text:
-                            processed_list.append(decoded_text)
-                        else:
-                            raise ValueError(f"无法解码token数组: {item[:10]}...")
-                    else:
-                        processed_list.append(item)
-                processed_data["input"] = processed_list
-                system_logger.info(f"✅ 自动解码列表中的token数组")
+    # 处理单个token数组
+    if is_token_array(input_data):
+        # 尝试解码token数组
+        decoded_text = try_decode_tokens(input_data)
+        if decoded_text:
+            processed_data["input"] = decoded_text
+            system_logger.info("✅ 自动解码token数组为文本: '{}...'", decoded_text[:50])
+        else:
+            raise ValueError(
+                f"检测到tokenized数字数组但无法解码。请发送原始文本字符串而不是token数组。"
+                f"\n正确格式: '原始文本字符串'"
+                f"\n错误格式: {input_data[:10]}..."
+            )
+        return processed_data
+
+    # 处理包含token数组的列表（每个元素只判断一次；同一请求内重复的token数组只解码一次，并一起批量解码）
+    pending: Dict[tuple, list] = {}
+    for item in input_data:
+        if is_token_array(item):
+            pending.setdefault(tuple(item), item)
+    if not pending:
+        return processed_data
+
+    decoded_texts = try_decode_token_arrays(list(pending.values()))
+    decoded_by_tokens: Dict[tuple, str] = {}
+    for key, decoded_text in zip(pending, decoded_texts):
+        if not decoded_text:
+            raise ValueError(f"无法解码token数组: {pending[key][:10]}...")
+        decoded_by_tokens[key] = decoded_text
+
+    processed_data["input"] = [
+        decoded_by_tokens[tuple(item)] if is_token_array(item) else item
+        for item in input_data
+    ]
+    system_logger.info(f"✅ 自动解码列表中的token数组")
 
     return processed_data
 
 
 def try_decode_tokens(input_data) -> Optional[str]:
     """
-    尝试将tokenized数组解码为文本
+    尝试将tokenized数组解码为文本（调用方已确认输入为非空token数组）
     """
-    try:
-        import tiktoken
-
-        if isinstance(input_data, list) and len(input_data) > 0:
-            if all(isinstance(x, int) for x in input_data):
-                # 尝试使用不同的编码器解码
-                encoders = ["cl100k_base", "gpt2", "r50k_base", "p50k_base"]
-
-                for encoder_name in encoders:
-                    try:
-                        encoding = tiktoken.get_encoding(encoder_name)
-                        decoded_text = encoding.decode(input_data)
-                        if decoded_text and len(decoded_text.strip()) > 0:
-                            system_logger.info(f"🔄 使用{encoder_name}解码: {len(input_data)} tokens -> 文本")
-                            return decoded_text
-                    except Exception:
-                        continue
-
-                # 如果所有编码器都失败，返回None
-                system_logger.warning(f"⚠️ 无法解码token数组: {input_data[:10]}...")
-                return None
-
-        return None
-    except ImportError:
+    if not TIKTOKEN_AVAILABLE:
         system_logger.warning("⚠️ tiktoken库未安装，无法解码token数组")
         return None
+    try:
+        # 按token id范围确定编码尝试顺序（编码器和解码结果均已缓存）
+        decoded = decode_token_array(input_data)
+        if decoded is not None:
+            encoder_name, decoded_text = decoded
+            system_logger.info("🔄 使用{}解码: {} tokens -> 文本", encoder_name, len(input_data))
+            return decoded_text
+
+        # 如果所有编码器都失败，返回None
+        system_logger.warning("⚠️ 无法解码token数组: {}...", input_data[:10])
+        return None
     except Exception as e:
         system_logger.error(f"解码token数组时出错: {e}")
         return None
 
 
+def try_decode_token_arrays(arrays: list) -> list:
+    """
+    批量解码列表输入中的多个token数组，返回与输入一一对应的文本（无法解码的为None）
+    """
+    if not TIKTOKEN_AVAILABLE:
+        system_logger.warning("⚠️ tiktoken库未安装，无法解码token数组")
+        return [None] * len(arrays)
+    try:
+        decoded = decode_token_arrays(arrays)
+    except Exception as e:
+        system_logger.error(f"解码token数组时出错: {e}")
+        return [None] * len(arrays)
+
+    texts = []
+    for tokens, result in zip(arrays, decoded):
+        if result is None:
+            system_logger.warning("⚠️ 无法解码token数组: {}...", tokens[:10])
+            texts.append(None)
+        else:
+            encoder_name, decoded_text = result
+            system_logger.info("🔄 使用{}解码: {} tokens -> 文本", encoder_name, len(tokens))
+            texts.append(decoded_text)
+    return texts
+
+
 # === API路由定义 ===
 
-@app.get("/", response_model=HealthResponse)
-async def root():
-    """健康检查和服务信息"""
-    return HealthResponse(
+@lru_cache(maxsize=4)
+def build_health_body(status: str, description: str, timestamp: int) -> bytes:
+    """构建健康检查响应体（除时间戳外均为固定内容，同一秒内的探测请求直接复用）"""
+    return ORJSONResponse(content=HealthResponse(
         service=settings.app_name,
-        status="running",
+        status=status,
         version=settings.app_version,
-        description="LLM API网关服务 - 统一多模型为OpenAI格式"
+        description=description,
+        timestamp=timestamp
+    ).model_dump()).body
+
+
+@app.get("/", responses={200: {"model": HealthResponse}})
+async def root():
+    """健康检查和服务信息"""
+    return Response(
+        content=build_health_body("running", "LLM API网关服务 - 统一多模型为OpenAI格式", now_seconds()),
+        media_type="application/json"
     )
 
 
-@app.get("/health", response_model=HealthResponse)
+@app.get("/health", responses={200: {"model": HealthResponse}})
 async def health_check():
     """详细健康检查"""
-    return HealthResponse(
-        service=settings.app_name,
-        status="healthy",
-        version=settings.app_version,
-        description="所有系统正常运行"
+    return Response(
+        content=build_health_body("healthy", "所有系统正常运行", now_seconds()),
+        media_type="application/json"
     )
 
 
-@app.get("/v1/models", response_model=ModelList)
+@lru_cache(maxsize=1)
+def build_model_list_body(created: int) -> bytes:
+    """构建模型列表响应体（模型列表固定，按分钟更新created后缓存；直接构建dict，与ModelList结构一致）"""
+    return ORJSONResponse(content={
+        "object": "list",
+        "data": [
+            {"id": model_id, "object": "model", "created": created, "owned_by": "llmcallgateway"}
+            for model_id in llm_service.get_available_models()
+        ]
+    }).body
+
+
+@app.get("/v1/models", responses={200: {"model": ModelList}})
 async def list_models():
     """获取可用模型列表"""
     try:
-        available_models = llm_service.get_available_models()
-        
-        models = [
-            Model(
-                id=model_id,
-                created=int(time.time()),
-                owned_by="llmcallgateway"
-            )
-            for model_id in available_models
-        ]
-        
-        system_logger.info(f"📋 返回模型列表: {len(models)} 个模型")
-        return ModelList(data=models)
+        body = build_model_list_body(now_seconds() // 60 * 60)
+        system_logger.info("📋 返回模型列表: {} 个模型", len(llm_service.get_available_models()))
+        # 直接返回缓存的JSON字节，跳过每次请求的模型构建和序列化
+        return Response(content=body, media_type="application/json")
     
     except Exception as e:
         system_logger.error(f"获取模型列表失败: {e}")
         raise create_error_response("获取模型列表失败", "models_error", 500)
 
 
-@app.post("/v1/chat/completions")
-async def create_chat_completion(request: ChatCompletionRequest, http_request: Request):
+@app.post(
+    "/v1/chat/completions",
+    openapi_extra=openapi_request_body(ChatCompletionRequest, "/v1/chat/completions"),
+)
+async def create_chat_completion(http_request: Request, user_id: Optional[str] = Depends(get_user_id)):
     """创建聊天补全"""
+    # 使用TypeAdapter直接解析原始请求体，校验失败时交由422异常处理器处理
     try:
-        # 提取用户ID
-        user_id = extract_user_id_from_request(http_request)
-        
-        # 基本验证
-        if not request.messages:
-            raise create_error_response("消息列表不能为空", "invalid_request", 400)
-        
-        if not request.model:
-            raise create_error_response("模型名称不能为空", "invalid_request", 400)
-        
-        # 调用LLM服务
+        request = CHAT_COMPLETION_REQUEST_ADAPTER.validate_json(await http_request.body())
+    except ValidationError as e:
+        # 直接构建与422异常处理器相同的响应，只取loc/msg/type，不生成文档链接、上下文和原始输入
+        return validation_error_response([
+            {"loc": ("body", *error["loc"]), "msg": error["msg"], "type": error["type"]}
+            for error in e.errors(include_url=False, include_context=False, include_input=False)
+        ])
+
+    try:
+        # 调用LLM服务（消息列表和模型名称非空已由请求模型校验）
         result = await llm_service.create_chat_completion(request, user_id)
         
         # 根据响应类型返回
         if request.stream:
+            # 同步迭代器会被StreamingResponse放到线程池逐块迭代，这里必须是异步生成器
+            if settings.debug:
+                assert inspect.isasyncgen(result), "流式响应必须是异步生成器"
             return StreamingResponse(
                 result,
                 media_type="text/event-stream",
                 headers={
                     "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "Content-Type": "text/event-stream"
+                    "Connection": "keep-alive"
                 }
             )
         else:
-            return result
+            # 响应模型直接由orjson序列化，跳过jsonable_encoder
+            return ORJSONResponse(content=result.model_dump())
     
     except HTTPException:
         raise
@@ -263,17 +388,14 @@ async def create_chat_completion(request: ChatCompletionRequest, http_request: R
         raise create_error_response(f"请求处理失败: {str(e)}", "completion_error", 500)
 
 
-@app.post("/v1/embeddings", response_model=EmbeddingResponse)
 async def create_embeddings(http_request: Request):
     """创建文本嵌入 - 支持自动token解码"""
+    user_id = await get_user_id(http_request)
     try:
-        # 提取用户ID
-        user_id = extract_user_id_from_request(http_request)
-
-        # 获取原始JSON数据
-        raw_data = await http_request.json()
+        # 获取原始JSON数据（按bytes一次解析；完整请求体只在DEBUG级别延迟格式化输出）
+        raw_data = parse_json_body(await http_request.body())
 
-        system_logger.info(f"原始JSON数据: {raw_data}")
+        system_logger.opt(lazy=True).debug("原始JSON数据: {}", lambda: raw_data)
 
         # 智能预处理输入数据
         processed_data = await preprocess_embedding_data(raw_data)
@@ -285,17 +407,19 @@ async def create_embeddings(http_request: Request):
             system_logger.error(f"请求验证失败: {e}")
             raise create_error_response(f"请求格式错误: {str(e)}", "invalid_request", 400)
 
-        # 基本验证
+        # 基本验证（模型名称非空已由请求模型校验）
         if not request.input:
             raise create_error_response("输入文本不能为空", "invalid_request", 400)
 
-        if not request.model:
-            raise create_error_response("模型名称不能为空", "invalid_request", 400)
-
         # 调用LLM服务
         result = await llm_service.create_embeddings(request, user_id)
 
-        return result
+        # 大批量结果逐条序列化并流式发送，降低峰值内存
+        if len(result.data) > EMBEDDING_STREAM_THRESHOLD:
+            return StreamingResponse(iter_embedding_json(result), media_type="application/json")
+
+        # 直接用orjson序列化，避免jsonable_encoder逐个遍历向量中的浮点数
+        return ORJSONResponse(content=result.model_dump())
 
     except HTTPException:
         raise
@@ -304,37 +428,74 @@ async def create_embeddings(http_request: Request):
         raise create_error_response(f"请求处理失败: {str(e)}", "embedding_error", 500)
 
 
-@app.get("/metrics", response_model=Dict[str, Any])
-async def get_metrics():
+# 嵌入接口自行解析请求体，按原始Request直接调用，省去每次请求的依赖求解
+app.router.add_api_route(
+    "/v1/embeddings",
+    create_embeddings,
+    methods=["POST"],
+    responses={200: {"model": EmbeddingResponse}},
+    openapi_extra=openapi_request_body(EmbeddingRequest, "/v1/embeddings"),
+    route_class_override=RawRequestRoute,
+)
+
+
+# 各指标接口最近一次的 (ETag, 响应体)
+_metrics_bodies: Dict[str, Tuple[str, bytes]] = {}
+
+
+def metrics_response(request: Request, name: str, etag: str, build: Callable[[], Any]) -> Response:
+    """返回指标快照：客户端ETag未变化时返回304，数据未变化时复用已序列化的响应体"""
+    etag = f'"{etag}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    cached = _metrics_bodies.get(name)
+    if cached is None or cached[0] != etag:
+        cached = _metrics_bodies[name] = (etag, ORJSONResponse(content=build()).body)
+    return Response(content=cached[1], media_type="application/json", headers={"ETag": etag})
+
+
+def build_metrics_stats() -> Dict[str, Any]:
+    """构建服务指标"""
+    stats = metrics_collector.get_current_stats()
+    # LLM交互日志队列已满时丢弃的记录数
+    stats['llm_log_dropped'] = llm_interaction_logger.dropped
+    return stats
+
+
+@app.get("/metrics", responses={200: {"model": Dict[str, Any]}})
+async def get_metrics(request: Request):
     """获取服务指标"""
     try:
-        stats = metrics_collector.get_current_stats()
-        return stats
+        etag = f"{metrics_collector.snapshot_tag()}-{llm_interaction_logger.dropped}"
+        return metrics_response(request, "stats", etag, build_metrics_stats)
     except Exception as e:
         system_logger.error(f"获取指标失败: {e}")
         raise create_error_response("获取指标失败", "metrics_error", 500)
 
 
 @app.get("/metrics/models")
-async def get_model_metrics():
+async def get_model_metrics(request: Request):
     """获取按模型分组的指标"""
     try:
-        model_stats = metrics_collector.get_model_stats()
-        return model_stats
+        return metrics_response(
+            request, "models", metrics_collector.snapshot_tag(), metrics_collector.get_model_stats
+        )
     except Exception as e:
         system_logger.error(f"获取模型指标失败: {e}")
         raise create_error_response("获取模型指标失败", "metrics_error", 500)
 
 
 @app.get("/metrics/trends")
-async def get_metrics_trends(hours: int = 24):
+async def get_metrics_trends(request: Request, hours: int = 24):
     """获取指标趋势数据"""
     try:
         if hours < 1 or hours > 168:  # 最多7天
             hours = 24
         
-        trends = metrics_collector.get_hourly_trends(hours)
-        return trends
+        return metrics_response(
+            request, "trends", f"{metrics_collector.snapshot_tag()}-{hours}",
+            lambda: metrics_collector.get_hourly_trends(hours)
+        )
     except Exception as e:
         system_logger.error(f"获取趋势数据失败: {e}")
         raise create_error_response("获取趋势数据失败", "metrics_error", 500)
@@ -354,6 +515,26 @@ async def reset_metrics():
 
 # === 错误处理 ===
 
+# tokenized输入错误的固定响应体
+TOKENIZED_INPUT_ERROR_BODY = ORJSONResponse(content={
+    "error": {
+        "message": "输入格式错误：检测到tokenized数字数组",
+        "type": "invalid_request_error",
+        "code": "invalid_input_format",
+        "details": "embeddings API需要原始文本字符串，不接受tokenized的数字数组。",
+        "correct_examples": {
+            "single_text": '{"input": "Hello world", "model": "text-embedding-3-small"}',
+            "multiple_texts": '{"input": ["Hello", "World"], "model": "text-embedding-3-small"}'
+        },
+        "common_mistakes": [
+            "❌ 不要发送: {\"input\": [3134, 419, 57086], ...}",
+            "❌ 不要发送: {\"input\": [[3134, 419]], ...}",
+            "✅ 应该发送: {\"input\": \"原始文本字符串\", ...}"
+        ]
+    }
+}).body
+
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     """输入验证异常处理器 - 专门处理422错误"""
@@ -364,8 +545,8 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
             if ('input' in error.get('loc', []) and
                 error.get('type') == 'string_type' and
                 isinstance(error.get('input'), list) and
-                len(error.get('input', [])) > 0 and
-                all(isinstance(x, int) for x in error.get('input', [])[:10])):  # 检查前10个元素
+                error['input'] and
+                is_token_array(error['input'][:10])):  # 检查前10个元素，遇到非整数立即停止
                 return True
         return False
 
@@ -374,52 +555,20 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     errors = exc.errors()
 
     if is_embedding_request and is_tokenized_input_error(errors):
-        # 针对tokenized输入提供专门的错误信息
-        return JSONResponse(
-            status_code=422,
-            content={
-                "error": {
-                    "message": "输入格式错误：检测到tokenized数字数组",
-                    "type": "invalid_request_error",
-                    "code": "invalid_input_format",
-                    "details": "embeddings API需要原始文本字符串，不接受tokenized的数字数组。",
-                    "correct_examples": {
-                        "single_text": '{"input": "Hello world", "model": "text-embedding-3-small"}',
-                        "multiple_texts": '{"input": ["Hello", "World"], "model": "text-embedding-3-small"}'
-                    },
-                    "common_mistakes": [
-                        "❌ 不要发送: {\"input\": [3134, 419, 57086], ...}",
-                        "❌ 不要发送: {\"input\": [[3134, 419]], ...}",
-                        "✅ 应该发送: {\"input\": \"原始文本字符串\", ...}"
-                    ]
-                }
-            }
-        )
+        # 针对tokenized输入提供专门的错误信息（响应体为固定内容，启动时已序列化）
+        return Response(content=TOKENIZED_INPUT_ERROR_BODY, status_code=422, media_type="application/json")
 
     # 通用验证错误处理
-    return JSONResponse(
-        status_code=422,
-        content={
-            "error": {
-                "message": "请求格式验证失败",
-                "type": "validation_error",
-                "details": [
-                    {
-                        "loc": error["loc"],
-                        "msg": error["msg"],
-                        "type": error["type"]
-                    }
-                    for error in errors
-                ]
-            }
-        }
-    )
+    return validation_error_response([
+        {"loc": error["loc"], "msg": error["msg"], "type": error["type"]}
+        for error in errors
+    ])
 
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     """HTTP异常处理器"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content=exc.detail if isinstance(exc.detail, dict) else {"error": {"message": exc.detail}}
     )
@@ -429,7 +578,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 async def general_exception_handler(request: Request, exc: Exception):
     """通用异常处理器"""
     system_logger.error(f"未处理的异常: {exc}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "error": {
@@ -451,6 +600,7 @@ def main():
     system_logger.info(f"   Debug: {settings.debug}")
     system_logger.info(f"   Log Level: {settings.log_level}")
     system_logger.info(f"   Reload: {settings.reload}")
+    system_logger.info(f"   Workers: {settings.workers}")
     
     if settings.reload:
         system_logger.info("🔄 热重载模式启用")
@@ -460,6 +610,7 @@ def main():
             port=settings.port,
             reload=True,
             reload_excludes=["logs/*", "*.log"],
+            loop=EVENT_LOOP,
             log_level=settings.log_level.lower()
         )
     else:
@@ -469,6 +620,9 @@ def main():
             host=settings.host,
             port=settings.port,
             reload=False,
+            workers=settings.workers,
+            loop=EVENT_LOOP,
+            http=HTTP_PROTOCOL,
             log_level=settings.log_level.lower()
         )
 
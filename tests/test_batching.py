@@ -0,0 +1,102 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services.batching import BatchCoalescer, EmbeddingBatcher
+
+
+def _fake_response(n):
+    return SimpleNamespace(
+        id="chatcmpl-1",
+        model="gpt-4o-mini",
+        choices=[SimpleNamespace(index=i, message=f"reply {i}") for i in range(n)],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=4 * n, total_tokens=10 + 4 * n),
+    )
+
+
+def test_coalescer_merges_identical_requests_into_one_call():
+    coalescer = BatchCoalescer(window=0.01, max_batch=8)
+    calls = []
+
+    async def call(request):
+        calls.append(request)
+        return _fake_response(request.get("n") or 1)
+
+    request = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}], "n": 1}
+
+    async def scenario():
+        return await asyncio.gather(*(coalescer.submit(dict(request), call) for _ in range(3)))
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1 and calls[0]["n"] == 3
+    assert [r.choices[0].message for r in results] == ["reply 0", "reply 1", "reply 2"]
+    assert all(r.choices[0].index == 0 and r.usage.completion_tokens == 4 for r in results)
+    # 输入只处理一次：各请求分摊后的输入token之和等于下游统计
+    assert [r.usage.prompt_tokens for r in results] == [3, 3, 4]
+    assert sum(r.usage.total_tokens for r in results) == 10 + 4 * 3
+
+
+def test_coalescer_falls_back_when_downstream_ignores_n():
+    coalescer = BatchCoalescer(window=0.01, max_batch=8)
+    calls = []
+
+    async def call(request):
+        calls.append(request)
+        return _fake_response(1)
+
+    request = {"model": "claude-3-5-sonnet-20241022", "messages": [{"role": "user", "content": "hi"}]}
+
+    async def scenario():
+        return await asyncio.gather(*(coalescer.submit(dict(request), call) for _ in range(2)))
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 2
+    assert len(results) == 2
+
+
+def test_embedding_batcher_concatenates_inputs_and_splits_by_index():
+    batcher = EmbeddingBatcher(window=0.01, max_inputs=128)
+    calls = []
+
+    async def call(request):
+        calls.append(request)
+        return SimpleNamespace(
+            model=request["model"],
+            data=[{"object": "embedding", "embedding": [float(i)], "index": i} for i in range(len(request["input"]))],
+            usage=SimpleNamespace(prompt_tokens=30, total_tokens=30),
+        )
+
+    async def scenario():
+        return await asyncio.gather(
+            batcher.submit({"model": "text-embedding-3-small", "input": "a"}, call),
+            batcher.submit({"model": "text-embedding-3-small", "input": ["b", "c"]}, call),
+        )
+
+    single, pair = asyncio.run(scenario())
+
+    assert len(calls) == 1 and calls[0]["input"] == ["a", "b", "c"]
+    assert [item["embedding"] for item in single.data] == [[0.0]]
+    assert [(item["index"], item["embedding"]) for item in pair.data] == [(0, [1.0]), (1, [2.0])]
+    assert (single.usage.prompt_tokens, pair.usage.prompt_tokens) == (10, 20)
+
+
+def test_embedding_batcher_usage_split_keeps_remainder():
+    batcher = EmbeddingBatcher(window=0.01, max_inputs=128)
+
+    async def call(request):
+        return SimpleNamespace(
+            model=request["model"],
+            data=[{"object": "embedding", "embedding": [0.0], "index": i} for i in range(len(request["input"]))],
+            usage=SimpleNamespace(prompt_tokens=10, total_tokens=10),
+        )
+
+    async def scenario():
+        return await asyncio.gather(
+            *(batcher.submit({"model": "text-embedding-3-small", "input": text}, call) for text in "abc")
+        )
+
+    results = asyncio.run(scenario())
+
+    # 10个token分给3个请求：余数计入最后一个，合计与下游统计一致
+    assert [r.usage.prompt_tokens for r in results] == [3, 3, 4]
@@ -0,0 +1,113 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.models.api_models import ChatCompletionResponse
+from app.services import cache as cache_module
+from app.services.cache import RedisResponseCache, ResponseCache, SemanticCache
+
+
+def test_response_cache_key_ignores_dict_order():
+    first = ResponseCache.make_key({"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}]})
+    second = ResponseCache.make_key({"messages": [{"content": "hi", "role": "user"}], "model": "gpt-4o-mini"})
+    assert first == second
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_response_cache_expires_entries():
+    cache = ResponseCache(maxsize=2, ttl=-1)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_semantic_cache_matches_similar_vectors_within_bucket():
+    cache = SemanticCache(threshold=0.9, maxsize_per_bucket=4, ttl=60)
+    messages = [{"role": "system", "content": "助手"}, {"role": "user", "content": "解释X"}]
+    bucket = SemanticCache.make_bucket({"model": "gpt-4o-mini", "messages": messages})
+    cache.add(bucket, [1.0, 0.0, 0.0], "cached")
+
+    assert cache.lookup(bucket, [0.99, 0.05, 0.0]) == "cached"
+    assert cache.lookup(bucket, [0.0, 1.0, 0.0]) is None
+    other_bucket = SemanticCache.make_bucket({"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "解释X"}]})
+    assert other_bucket != bucket
+    assert cache.lookup(other_bucket, [1.0, 0.0, 0.0]) is None
+
+
+def test_semantic_cache_buckets_separate_generation_params():
+    messages = [{"role": "user", "content": "解释X"}]
+    base = {"model": "gpt-4o-mini", "messages": messages, "temperature": 0, "max_tokens": 16, "n": 1}
+    cache = SemanticCache(threshold=0.9, maxsize_per_bucket=4, ttl=60)
+    cache.add(SemanticCache.make_bucket(base), [1.0, 0.0], "short answer")
+
+    # max_tokens或n不同的请求不会命中彼此的缓存
+    for variant in ({**base, "max_tokens": 2000}, {**base, "n": 3}):
+        assert cache.lookup(SemanticCache.make_bucket(variant), [1.0, 0.0]) is None
+    # user和stream不影响分桶
+    same = {**base, "user": "u-1", "stream": False, "messages": [{"role": "user", "content": "说明X"}]}
+    assert cache.lookup(SemanticCache.make_bucket(same), [1.0, 0.0]) == "short answer"
+
+
+def test_semantic_cache_evicts_least_recently_used_bucket():
+    cache = SemanticCache(threshold=0.9, maxsize_per_bucket=4, ttl=60, max_buckets=2)
+    # 仅生成参数不同的请求各占一个分桶，同样受分桶上限约束
+    a, b, c = (
+        SemanticCache.make_bucket({"model": "gpt-4o-mini", "messages": [], "max_tokens": max_tokens})
+        for max_tokens in (16, 32, 64)
+    )
+    cache.add(a, [1.0, 0.0], "A")
+    cache.add(b, [1.0, 0.0], "B")
+    assert cache.lookup(a, [1.0, 0.0]) == "A"
+    cache.add(c, [1.0, 0.0], "C")
+
+    assert list(cache._buckets) == [a, c]
+    assert cache.lookup(b, [1.0, 0.0]) is None
+
+
+def test_semantic_cache_drops_expired_buckets():
+    cache = SemanticCache(threshold=0.9, maxsize_per_bucket=4, ttl=-1)
+    cache.add("a", [1.0, 0.0], "A")
+
+    assert cache.lookup("a", [1.0, 0.0]) is None
+    assert len(cache._buckets) == 0
+
+
+def test_redis_cache_treats_undecodable_value_as_miss(monkeypatch):
+    store = {}
+
+    class FakeRedis:
+        async def get(self, key):
+            return store.get(key)
+
+        async def set(self, key, value, ex=None):
+            store[key] = value
+
+        async def delete(self, key):
+            store.pop(key, None)
+
+    monkeypatch.setattr(cache_module, "redis_asyncio", SimpleNamespace(from_url=lambda url: FakeRedis()))
+    cache = RedisResponseCache("redis://fake", ttl=60)
+    response = ChatCompletionResponse(id="r1", model="gpt-4o-mini", choices=[])
+
+    async def scenario():
+        # 旧版本结构的缓存值
+        store[cache.prefix + "old"] = b'{"id": "r0"}'
+        stale = await cache.aget("old")
+        await cache.aset("new", response)
+        return stale, await cache.aget("new")
+
+    stale, fresh = asyncio.run(scenario())
+
+    assert stale is None and cache.prefix + "old" not in store
+    assert fresh == response
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,165 @@
+from collections import OrderedDict
+
+from app.utils import helpers
+
+
+def test_count_tokens_reuses_cached_encoder(monkeypatch):
+    class FakeEncoder:
+        def encode_ordinary(self, text):
+            return text.split()
+
+    # 编码按编码名称缓存，不同模型名称共用同一编码
+    monkeypatch.setitem(helpers._TOKEN_ENCODINGS, helpers.token_encoding_name("gpt-4o-mini"), FakeEncoder())
+    monkeypatch.setattr(helpers, "_TOKEN_ENCODING_FAILURES", {"cl100k_base": float("inf")})
+
+    assert helpers.count_tokens("one two three", "gpt-4o-mini") == 3
+    assert helpers.count_tokens("one two", "openai/gpt-4o-mini") == 2
+    assert helpers.count_tokens("", "gpt-4o-mini") == 0
+    # 编码器不可用时回退到字符估算
+    assert helpers.count_tokens("abcdefgh", "offline-model") == helpers.calculate_tokens_estimate("abcdefgh")
+
+
+def test_token_encoding_load_failure_is_retried(monkeypatch):
+    attempts = []
+
+    class FakeTiktoken:
+        @staticmethod
+        def get_encoding(name):
+            attempts.append(name)
+            if len(attempts) == 1:
+                raise OSError("network unavailable")
+            return "encoding"
+
+    monkeypatch.setattr(helpers, "tiktoken", FakeTiktoken)
+    monkeypatch.setattr(helpers, "_TOKEN_ENCODINGS", {})
+    monkeypatch.setattr(helpers, "_TOKEN_ENCODING_FAILURES", {})
+
+    assert helpers.get_token_encoding("cl100k_base") is None
+    # 重试间隔内不再加载
+    assert helpers.get_token_encoding("cl100k_base") is None
+    assert len(attempts) == 1
+
+    monkeypatch.setattr(helpers, "TOKEN_ENCODING_RETRY_INTERVAL", 0.0)
+    assert helpers.get_token_encoding("cl100k_base") == "encoding"
+    assert helpers.get_token_encoding("cl100k_base") == "encoding"
+    assert len(attempts) == 2
+
+
+def test_token_decode_order_prefers_cl100k_and_skips_by_id_range():
+    # cl100k_base的 "Hello world" 全部小于gpt2词表大小，仍应先尝试cl100k_base
+    assert helpers.token_decode_order([9906, 1917]) == ("cl100k_base", "gpt2", "r50k_base", "p50k_base")
+    # 超出gpt2词表的id不再尝试gpt2/r50k_base
+    assert helpers.token_decode_order([3134, 86000]) == ("cl100k_base", "p50k_base")
+
+
+def test_is_token_array():
+    assert helpers.is_token_array([9906, 1917])
+    assert not helpers.is_token_array([9906, "1917"])
+    assert not helpers.is_token_array("9906")
+
+
+def test_calculate_tokens_estimate_counts_chinese_chars(monkeypatch):
+    text = "hello world 你好世界 " * 10
+    expected = int(40 / 1.5 + (len(text) - 40) / 4.0)
+
+    assert helpers.calculate_tokens_estimate(text) == expected
+    # 未安装numpy时走正则统计，结果一致
+    monkeypatch.setattr(helpers, "np", None)
+    assert helpers.calculate_tokens_estimate(text) == expected
+    assert helpers.calculate_tokens_estimate("abcdefgh") == 2
+
+
+def test_sanitize_log_content_masks_sensitive_values():
+    content = 'API_KEY=sk-abc123 {"password": "hunter2"} token: t.1-2 keyboard=ok'
+
+    assert helpers.sanitize_log_content(content) == (
+        'API_KEY=*** {"password": "***"} token: *** keyboard=ok'
+    )
+    assert helpers.sanitize_log_content("x" * 20, max_length=10) == "x" * 10 + "..."
+
+
+def test_extract_user_id_from_request_prefers_bearer_token():
+    from starlette.requests import Request
+
+    def build(headers, query=b""):
+        return Request({"type": "http", "headers": headers, "query_string": query})
+
+    assert helpers.extract_user_id_from_request(
+        build([(b"x-user-id", b"u-1"), (b"authorization", b"Bearer " + b"t" * 40)])
+    ) == "t" * 16
+    assert helpers.extract_user_id_from_request(build([(b"authorization", b"Basic x"), (b"x-user-id", b"u-1")])) == "u-1"
+    assert helpers.extract_user_id_from_request(build([], b"user_id=u-2")) == "u-2"
+    assert helpers.extract_user_id_from_request(build([])) is None
+
+
+def test_validate_model_name_rejects_whitespace():
+    assert helpers.validate_model_name("gpt-4o-mini")
+    assert not helpers.validate_model_name("gpt 4o")
+    assert not helpers.validate_model_name("gpt-4o\n")
+    assert not helpers.validate_model_name("x" * 101)
+    assert not helpers.validate_model_name("")
+
+
+def test_format_duration_tiers():
+    assert helpers.format_duration(0.0125) == "12.5ms"
+    assert helpers.format_duration(5.5) == "5.50s"
+    assert helpers.format_duration(125.25) == "2m 5.2s"
+    assert helpers.format_duration(7384.9) == "2h 3m"
+
+
+def test_decode_token_array_caches_repeated_arrays(monkeypatch):
+    calls = []
+
+    class FakeEncoding:
+        def decode(self, tokens):
+            calls.append(tuple(tokens))
+            return "hello world"
+
+    monkeypatch.setattr(helpers, "get_token_encoding", lambda name: FakeEncoding())
+    monkeypatch.setattr(helpers, "_TOKEN_DECODE_CACHE", OrderedDict())
+
+    assert helpers.decode_token_array([15496, 995]) == ("cl100k_base", "hello world")
+    assert helpers.decode_token_array([15496, 995]) == ("cl100k_base", "hello world")
+    assert calls == [(15496, 995)]
+
+    long_tokens = [1] * (helpers.TOKEN_DECODE_CACHE_MAX_TOKENS + 1)
+    helpers.decode_token_array(long_tokens)
+    helpers.decode_token_array(long_tokens)
+    assert len(calls) == 3
+
+
+def test_decode_token_arrays_batches_misses_and_fills_cache(monkeypatch):
+    batches = []
+
+    class FakeEncoding:
+        def __init__(self, name):
+            self.name = name
+
+        def decode(self, tokens):
+            # [7] 在cl100k_base下解码为空白，需回退到后续编码
+            if list(tokens) == [7] and self.name == "cl100k_base":
+                return " "
+            return f"{self.name}:{len(tokens)}"
+
+        def decode_batch(self, batch, num_threads=8):
+            batches.append((self.name, len(batch)))
+            return [self.decode(tokens) for tokens in batch]
+
+    monkeypatch.setattr(helpers, "get_token_encoding", FakeEncoding)
+    monkeypatch.setattr(helpers, "TOKEN_DECODE_BATCH_MIN", 2)
+    monkeypatch.setattr(helpers, "_TOKEN_DECODE_CACHE", OrderedDict())
+
+    arrays = [[1, 2], [7], [60000, 3], [4]]
+    expected = [
+        ("cl100k_base", "cl100k_base:2"),
+        ("gpt2", "gpt2:1"),  # 批量结果为空白时逐个按尝试顺序解码
+        ("cl100k_base", "cl100k_base:2"),
+        ("cl100k_base", "cl100k_base:1"),
+    ]
+    assert helpers.decode_token_arrays(arrays) == expected
+    assert batches == [("cl100k_base", 4)]
+
+    # 批量解码的结果写入缓存，重复请求不再解码
+    assert helpers.decode_token_arrays(arrays) == expected
+    assert helpers.decode_token_array([1, 2]) == expected[0]
+    assert batches == [("cl100k_base", 4)]
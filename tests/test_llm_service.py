@@ -93,6 +93,32 @@ def test_prepare_litellm_request_accepts_legacy_function_call_messages():
     assert assistant_msg["content"] is None
 
 
+def test_prepare_litellm_request_adds_prompt_cache_hints():
+    service = _build_service()
+    messages = [
+        ChatMessage(role="system", content="你是音乐助理"),
+        ChatMessage(role="user", content="推荐一首歌"),
+    ]
+
+    claude_payload = service._prepare_litellm_request(
+        ChatCompletionRequest(model="claude-3-5-sonnet-20241022", messages=messages)
+    )
+    assert claude_payload["messages"][0]["content"] == [
+        {"type": "text", "text": "你是音乐助理", "cache_control": {"type": "ephemeral"}}
+    ]
+
+    gpt_payload = service._prepare_litellm_request(
+        ChatCompletionRequest(model="gpt-4o-mini", messages=messages)
+    )
+    assert len(gpt_payload["prompt_cache_key"]) == 32
+    assert gpt_payload["messages"][0]["content"] == "你是音乐助理"
+
+    opted_out = service._prepare_litellm_request(
+        ChatCompletionRequest(model="gpt-4o-mini", messages=messages, prompt_cache=False)
+    )
+    assert "prompt_cache_key" not in opted_out
+
+
 def test_extract_tool_calls_returns_models_and_logs():
     service = _build_service()
 
@@ -125,3 +151,338 @@ def test_extract_function_call_payload_keeps_arguments_string():
     payload = service._extract_function_call_payload(Message())
 
     assert payload == {"name": "get_weather", "arguments": "{'city': 'Shanghai'}"}
+
+
+def test_stream_completion_yields_chunks_and_done(monkeypatch):
+    import asyncio
+
+    from app.services import llm_service as llm_service_module
+
+    original_acompletion = llm_service_module.acompletion
+
+    async def fake_acompletion(**kwargs):
+        return await original_acompletion(mock_response="Hello there", **kwargs)
+
+    monkeypatch.setattr(llm_service_module, "acompletion", fake_acompletion)
+    service = _build_service()
+    request = ChatCompletionRequest(
+        model="gpt-4o-mini",
+        stream=True,
+        messages=[ChatMessage(role="user", content="hi")],
+    )
+
+    async def collect():
+        stream = await service.create_chat_completion(request)
+        return [part async for part in stream]
+
+    parts = asyncio.run(collect())
+
+    assert parts[-1] == b"data: [DONE]\n\n"
+    chunks = [json.loads(part[len(b"data: "):]) for part in parts[:-1]]
+    assert chunks[0]["object"] == "chat.completion.chunk"
+    assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks) == "Hello there"
+
+
+def test_non_stream_completion_reuses_cached_response(monkeypatch):
+    import asyncio
+
+    from app.services import llm_service as llm_service_module
+    from app.services.cache import response_cache
+
+    original_acompletion = llm_service_module.acompletion
+    calls = []
+
+    async def fake_acompletion(**kwargs):
+        calls.append(kwargs)
+        return await original_acompletion(mock_response="cached answer", **kwargs)
+
+    monkeypatch.setattr(llm_service_module, "acompletion", fake_acompletion)
+    response_cache.clear()
+    service = _build_service()
+
+    def build_request():
+        return ChatCompletionRequest(
+            model="gpt-4o-mini",
+            temperature=0,
+            messages=[ChatMessage(role="user", content="ping")],
+        )
+
+    from app.services.metrics import metrics_collector
+
+    metrics_collector.reset_stats()
+    first = asyncio.run(service.create_chat_completion(build_request()))
+    second = asyncio.run(service.create_chat_completion(build_request()))
+
+    assert len(calls) == 1
+    assert second.choices[0].message.content == first.choices[0].message.content == "cached answer"
+    stats = metrics_collector.get_current_stats()
+    assert (stats["cache_hits"], stats["cache_misses"]) == (1, 1)
+
+
+def test_concurrent_identical_requests_share_one_downstream_call(monkeypatch):
+    import asyncio
+
+    from app.services import llm_service as llm_service_module
+
+    original_acompletion = llm_service_module.acompletion
+    calls = []
+
+    async def fake_acompletion(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.01)
+        return await original_acompletion(mock_response="shared answer", **kwargs)
+
+    monkeypatch.setattr(llm_service_module, "acompletion", fake_acompletion)
+    monkeypatch.setattr(llm_service_module.settings, "enable_response_cache", False)
+    service = _build_service()
+
+    def build_request():
+        return ChatCompletionRequest(
+            model="gpt-4o-mini",
+            temperature=0,
+            messages=[ChatMessage(role="user", content="ping")],
+        )
+
+    async def scenario():
+        return await asyncio.gather(
+            *(service.create_chat_completion(build_request()) for _ in range(3))
+        )
+
+    from app.services.metrics import metrics_collector
+
+    metrics_collector.reset_stats()
+    responses = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert [r.choices[0].message.content for r in responses] == ["shared answer"] * 3
+    assert service._inflight == {}
+    # 等待方拿到独立副本，且按去重计数而不是缓存命中
+    assert len({id(r) for r in responses}) == 3
+    stats = metrics_collector.get_current_stats()
+    assert (stats["deduplicated"], stats["cache_hits"]) == (2, 0)
+
+
+def test_model_slot_rejects_with_429_when_queue_times_out(monkeypatch):
+    import asyncio
+
+    import pytest
+    from fastapi import HTTPException
+
+    from app.services import llm_service as llm_service_module
+
+    monkeypatch.setattr(llm_service_module.settings, "per_model_concurrency", 1)
+    monkeypatch.setattr(llm_service_module.settings, "queue_timeout", 0.01)
+    service = _build_service()
+
+    async def scenario():
+        semaphore = await service._acquire_model_slot("gpt-4o-mini")
+        with pytest.raises(HTTPException) as exc_info:
+            await service._acquire_model_slot("gpt-4o-mini")
+        # 其他模型的名额互不影响
+        other = await service._acquire_model_slot("claude-3-5-sonnet-20241022")
+        semaphore.release()
+        other.release()
+        return exc_info.value.status_code
+
+    assert asyncio.run(scenario()) == 429
+
+
+def test_stream_releases_model_slot_when_never_iterated(monkeypatch):
+    import asyncio
+
+    import pytest
+    from fastapi import HTTPException
+
+    from app.services import llm_service as llm_service_module
+
+    monkeypatch.setattr(llm_service_module.settings, "per_model_concurrency", 1)
+    monkeypatch.setattr(llm_service_module.settings, "queue_timeout", 0.01)
+    service = _build_service()
+    request = ChatCompletionRequest(
+        model="gpt-4o-mini",
+        stream=True,
+        messages=[ChatMessage(role="user", content="hi")],
+    )
+
+    async def scenario():
+        stream = await service.create_chat_completion(request)
+        # 名额被占用时，新的流式请求直接返回429
+        with pytest.raises(HTTPException) as exc_info:
+            await service.create_chat_completion(request)
+        # 客户端在发送响应体前断开：生成器未被迭代即关闭，名额仍会释放
+        await stream.aclose()
+        return exc_info.value.status_code, service._semaphores["gpt-4o-mini"]._value
+
+    assert asyncio.run(scenario()) == (429, 1)
+
+
+def test_prepare_litellm_request_filters_params_per_model():
+    service = _build_service()
+    messages = [ChatMessage(role="user", content="hi")]
+
+    claude_payload = service._prepare_litellm_request(
+        ChatCompletionRequest(model="anthropic/claude-3-5-sonnet-20241022", messages=messages)
+    )
+    assert "n" not in claude_payload and "frequency_penalty" not in claude_payload
+    assert claude_payload["temperature"] == 1.0
+    assert "drop_params" not in claude_payload
+
+    unknown_payload = service._prepare_litellm_request(
+        ChatCompletionRequest(model="my-private-model", messages=messages)
+    )
+    assert unknown_payload["drop_params"] is True
+    assert unknown_payload["n"] == 1
+
+
+def test_stream_completion_accumulates_tool_call_arguments(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+
+    from app.core.logging import llm_interaction_logger
+    from app.services import llm_service as llm_service_module
+
+    def make_chunk(arguments, name=None, finish_reason=None):
+        function = SimpleNamespace(name=name, arguments=arguments)
+        tool_call = SimpleNamespace(id="call_1", type="function", function=function)
+        delta = SimpleNamespace(role=None, content=None, function_call=None, tool_calls=[tool_call])
+        choice = SimpleNamespace(index=0, delta=delta, finish_reason=finish_reason)
+        return SimpleNamespace(id="chatcmpl-1", model="gpt-4o-mini", choices=[choice], usage=None)
+
+    async def fake_stream():
+        yield make_chunk('{"city": ', name="get_weather")
+        yield make_chunk('"Shanghai"}', name="", finish_reason="tool_calls")
+
+    async def fake_acompletion(**kwargs):
+        return fake_stream()
+
+    completed = {}
+    monkeypatch.setattr(llm_service_module, "acompletion", fake_acompletion)
+    monkeypatch.setattr(
+        llm_interaction_logger,
+        "complete_interaction",
+        lambda request_id, response, *args, **kwargs: completed.update(response),
+    )
+    service = _build_service()
+    request = ChatCompletionRequest(
+        model="gpt-4o-mini",
+        stream=True,
+        messages=[ChatMessage(role="user", content="天气")],
+    )
+
+    async def collect():
+        stream = await service.create_chat_completion(request)
+        return [part async for part in stream]
+
+    parts = asyncio.run(collect())
+
+    assert len(parts) == 3
+    assert completed["tool_calls"] == [
+        {
+            "id": "call_1",
+            "type": "function",
+            "function": {"name": "get_weather", "arguments": '{"city": "Shanghai"}'},
+        }
+    ]
+
+
+def _embed_once(monkeypatch):
+    """以假的下游嵌入结果调用create_embeddings，返回响应"""
+    import asyncio
+    from types import SimpleNamespace
+
+    from app.models.api_models import EmbeddingRequest
+    from app.services import llm_service as llm_service_module
+
+    async def fake_aembedding(**kwargs):
+        return SimpleNamespace(
+            model=kwargs["model"],
+            data=[{"object": "embedding", "embedding": [0.5, -0.25, 1.0, 2.0], "index": 0}],
+            usage=SimpleNamespace(prompt_tokens=1, total_tokens=1),
+        )
+
+    monkeypatch.setattr(llm_service_module, "aembedding", fake_aembedding)
+    service = _build_service()
+    return asyncio.run(
+        service.create_embeddings(EmbeddingRequest(model="text-embedding-3-small", input="hi"))
+    )
+
+
+def _serialized_embeddings(response):
+    """分别通过ORJSONResponse和流式序列化得到的第一个嵌入向量"""
+    import asyncio
+
+    from app.utils.responses import ORJSONResponse, iter_embedding_json
+
+    async def stream_body():
+        return b"".join([part async for part in iter_embedding_json(response)])
+
+    return (
+        json.loads(ORJSONResponse(content=response.model_dump()).body)["data"][0]["embedding"],
+        json.loads(asyncio.run(stream_body()))["data"][0]["embedding"],
+    )
+
+
+def test_embedding_response_serializes_float32_arrays(monkeypatch):
+    import pytest
+
+    np = pytest.importorskip("numpy")
+    from app.models.api_models import EmbeddingArrayData
+
+    response = _embed_once(monkeypatch)
+
+    item = response.data[0]
+    assert isinstance(item, EmbeddingArrayData)
+    assert isinstance(item.embedding, np.ndarray) and item.embedding.dtype == np.float32
+    expected = [0.5, -0.25, 1.0, 2.0]
+    assert _serialized_embeddings(response) == (expected, expected)
+
+
+def test_embedding_response_keeps_float_lists_without_numpy(monkeypatch):
+    from app.models.api_models import EmbeddingFloatData
+    from app.utils import helpers
+
+    # 未安装numpy时float32数组转换原样返回浮点列表
+    monkeypatch.setattr(helpers, "np", None)
+    response = _embed_once(monkeypatch)
+
+    item = response.data[0]
+    assert isinstance(item, EmbeddingFloatData)
+    assert item.embedding == [0.5, -0.25, 1.0, 2.0]
+    assert _serialized_embeddings(response) == ([0.5, -0.25, 1.0, 2.0],) * 2
+
+def test_supported_params_cache_is_bounded():
+    from app.services import llm_service as llm_service_module
+
+    get_supported_params = llm_service_module.get_supported_params
+    assert get_supported_params.cache_info().maxsize == llm_service_module.SUPPORTED_PARAMS_CACHE_SIZE
+    assert get_supported_params("my-private-model") is None
+    assert "n" in get_supported_params("gpt-4o-mini")
+
+
+def test_supported_params_match_with_and_without_provider_prefix():
+    from app.services.llm_service import get_supported_params
+
+    assert get_supported_params("openai/gpt-4o") == get_supported_params("gpt-4o")
+    assert "user" in get_supported_params("openai/gpt-4o")
+
+    service = _build_service()
+    payloads = [
+        service._prepare_litellm_request(ChatCompletionRequest(
+            model=model, user="u-1", messages=[ChatMessage(role="user", content="hi")]
+        ))
+        for model in ("gpt-4o", "openai/gpt-4o")
+    ]
+    assert payloads[0]["user"] == payloads[1]["user"] == "u-1"
+    assert {k for k in payloads[0] if k != "model"} == {k for k in payloads[1] if k != "model"}
+
+
+def test_semantic_cache_skips_multi_choice_and_structured_output(monkeypatch):
+    from app.services import llm_service as llm_service_module
+
+    monkeypatch.setattr(llm_service_module.settings, "enable_semantic_cache", True)
+    service = _build_service()
+    request = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "hi"}], "temperature": 0}
+
+    assert service._semantic_cache_applicable(request)
+    assert not service._semantic_cache_applicable({**request, "n": 3})
+    assert not service._semantic_cache_applicable({**request, "response_format": {"type": "json_object"}})
@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+from loguru import logger
+
+from app.core.logging import LLMInteractionLogger
+
+
+def test_truncate_embedding_fields_does_not_mutate_input():
+    interaction_logger = LLMInteractionLogger()
+    response_data = {
+        "object": "list",
+        "data": [
+            {"object": "embedding", "embedding": [0.1, 0.2, 0.3, 0.4, 0.5], "index": 0},
+            {"object": "embedding", "embedding": "QUJDREVGR0hJSktMTU5PUA==", "index": 1},
+        ],
+        "model": "text-embedding-3-small",
+    }
+
+    truncated = interaction_logger._truncate_embedding_fields(response_data)
+
+    assert truncated["data"][0]["embedding"] == [0.1, 0.2, 0.3, "..."]
+    assert truncated["data"][1]["embedding"] == "QUJDREVGR0..."
+    assert truncated["model"] == "text-embedding-3-small"
+    assert response_data["data"][0]["embedding"] == [0.1, 0.2, 0.3, 0.4, 0.5]
+    assert response_data["data"][1]["embedding"] == "QUJDREVGR0hJSktMTU5PUA=="
+
+
+def test_background_flush_batches_interactions():
+    interaction_logger = LLMInteractionLogger()
+    written = []
+    handler_id = logger.add(
+        written.append,
+        format="{message}",
+        filter=lambda record: record["extra"].get("log_type") == "llm_interaction",
+    )
+
+    async def scenario():
+        interaction_logger.start_background_flush()
+        for request_id in ("req-1", "req-2"):
+            interaction_logger.start_interaction(request_id, "litellm", {"model": "gpt-4o-mini"})
+            interaction_logger.complete_interaction(request_id, {"ok": True}, 0.1)
+        assert written == []
+        await interaction_logger.stop_background_flush()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        logger.remove(handler_id)
+
+    # 每条交互单独一条记录
+    assert len(written) == 2
+    assert '"req-1"' in written[0] and '"req-2"' in written[1]
+
+
+def test_background_flush_writes_off_request_path_and_drops_on_overflow():
+    interaction_logger = LLMInteractionLogger()
+    interaction_logger._queue = asyncio.Queue(maxsize=2)
+    written = []
+    handler_id = logger.add(
+        written.append,
+        format="{message}",
+        filter=lambda record: record["extra"].get("log_type") == "llm_interaction",
+    )
+
+    async def scenario():
+        interaction_logger.start_background_flush()
+        for request_id in ("req-1", "req-2", "req-3"):
+            interaction_logger.start_interaction(request_id, "litellm", {"model": "gpt-4o-mini"})
+            interaction_logger.complete_interaction(request_id, {"ok": True}, 0.1)
+        # 后台任务取出记录并在线程中写出
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+            if len(written) == 2:
+                break
+        await interaction_logger.stop_background_flush()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        logger.remove(handler_id)
+
+    assert interaction_logger.dropped == 1
+    assert len(written) == 2
+    assert '"req-1"' in written[0] and '"req-2"' in written[1]
+
+
+def test_interactions_are_not_tracked_when_level_filtered():
+    interaction_logger = LLMInteractionLogger()
+    interaction_logger._min_level_no = logger.level("WARNING").no
+
+    interaction_logger.start_interaction("req-1", "litellm", {"model": "gpt-4o-mini"})
+    interaction_logger.complete_interaction("req-1", {"content": "ok"}, 0.1)
+
+    assert interaction_logger.interactions == {}
+
+
+def test_format_interaction_truncates_embedding_models_without_full_dump():
+    from app.core.logging import Interaction
+    from app.models.api_models import EmbeddingFloatData, EmbeddingResponse, Usage
+
+    interaction_logger = LLMInteractionLogger()
+    response = EmbeddingResponse(
+        data=[EmbeddingFloatData(embedding=[0.1] * 1536, index=0)],
+        model="text-embedding-3-small",
+        usage=Usage(prompt_tokens=2, completion_tokens=0, total_tokens=2),
+    )
+    interaction = Interaction(timestamp="t", request_id="req-1", provider="litellm", request_data={}, response=response)
+
+    record = json.loads(interaction_logger._format_interaction(interaction))
+
+    assert record["downstream_response"]["data"] == [{"object": "embedding", "embedding": [0.1, 0.1, 0.1, "..."], "index": 0}]
+    assert record["downstream_response"]["usage"]["total_tokens"] == 2
+
+
+def test_daily_size_rotation_parses_sizes_like_loguru():
+    from datetime import datetime
+    from types import SimpleNamespace
+
+    from app.core.logging import DailySizeRotation, daily_size_rotation
+
+    # 非大小类的配置原样交给loguru
+    assert daily_size_rotation("1 week") == "1 week"
+    assert daily_size_rotation("00:00") == "00:00"
+
+    rotation = daily_size_rotation("10 MB")
+    assert isinstance(rotation, DailySizeRotation)
+    assert rotation._max_bytes == 10_000_000
+    assert daily_size_rotation("10 MiB")._max_bytes == 10 * 1024 ** 2
+
+    class Message(str):
+        record = {"time": datetime.now()}
+
+    # 按utf-8字节数计算：6个中文字符占18字节
+    small = DailySizeRotation(20)
+    assert not small(Message("中文日志内容"), SimpleNamespace(tell=lambda: 0))
+    assert small(Message("中文日志内容"), SimpleNamespace(tell=lambda: 3))
@@ -0,0 +1,32 @@
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_chat_validation_error_body_shape():
+    client = TestClient(main.app)
+
+    response = client.post("/v1/chat/completions", json={"model": "gpt-4o-mini", "messages": []})
+
+    assert response.status_code == 422
+    error = response.json()["error"]
+    assert (error["message"], error["type"]) == ("请求格式验证失败", "validation_error")
+    assert error["details"] == [
+        {
+            "loc": ["body", "messages"],
+            "msg": "List should have at least 1 item after validation, not 0",
+            "type": "too_short",
+        }
+    ]
+
+
+def test_query_validation_error_uses_same_body_shape():
+    client = TestClient(main.app)
+
+    response = client.get("/metrics/trends", params={"hours": "abc"})
+
+    assert response.status_code == 422
+    details = response.json()["error"]["details"]
+    # 不输出原始输入、上下文和文档链接
+    assert [sorted(detail) for detail in details] == [["loc", "msg", "type"]]
+    assert details[0]["loc"] == ["query", "hours"]
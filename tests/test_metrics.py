@@ -0,0 +1,106 @@
+import time
+
+from app.models.api_models import RequestContext
+from app.services.metrics import MetricsCollector
+
+
+def _record(collector, request_id, model="gpt-4o-mini", success=True, tokens=10, start_time=None):
+    collector.start_request(RequestContext(
+        request_id=request_id,
+        start_time=start_time if start_time is not None else time.time(),
+        model=model,
+    ))
+    return collector.complete_request(request_id, success=success, prompt_tokens=tokens)
+
+
+def test_current_stats_merge_all_shards():
+    collector = MetricsCollector()
+    for index in range(40):
+        _record(collector, f"req-{index}", model="gpt-4o-mini" if index % 2 else "claude-3-haiku")
+    _record(collector, "req-failed", success=False)
+    collector.start_request(RequestContext(request_id="req-active", start_time=time.time(), model="gpt-4o-mini"))
+
+    stats = collector.get_current_stats()
+
+    assert stats["total_requests"] == 41
+    assert stats["total_tokens"] == 410
+    assert stats["success_rate"] == 40 / 41
+    assert stats["active_requests"] == 1
+    assert stats["models_used"] == {"gpt-4o-mini": 21, "claude-3-haiku": 20}
+    assert stats["requests_per_hour"] == 41
+
+    collector.reset_stats()
+    assert collector.get_current_stats()["total_requests"] == 0
+
+
+def test_model_stats_follow_history_window():
+    collector = MetricsCollector(max_history=3)
+    _record(collector, "req-1", model="claude-3-haiku", tokens=5)
+    _record(collector, "req-2", success=False)
+    _record(collector, "req-3")
+    _record(collector, "req-4")
+
+    # req-1被挤出历史窗口，其统计随之扣除
+    stats = collector.get_model_stats()
+
+    assert set(stats) == {"gpt-4o-mini"}
+    assert stats["gpt-4o-mini"]["requests"] == 3
+    assert stats["gpt-4o-mini"]["tokens"] == 30
+    assert stats["gpt-4o-mini"]["error_count"] == 1
+    assert stats["gpt-4o-mini"]["success_rate"] == 2 / 3
+
+
+def test_hourly_trends_read_ring_slots_oldest_first():
+    collector = MetricsCollector()
+    now = time.time()
+    # 与当前小时共用槽位的7天前记录不会被当作当前小时
+    _record(collector, "req-old", tokens=100, start_time=now - 168 * 3600)
+    _record(collector, "req-now", tokens=7)
+    _record(collector, "req-2h", tokens=3, start_time=now - 2 * 3600)
+
+    trends = collector.get_hourly_trends(hours=3)
+
+    assert trends["requests"] == [1, 0, 1]
+    assert trends["tokens"] == [3, 0, 7]
+    assert trends["hours"][-1] == time.strftime("%H:00", time.localtime(now))
+    assert collector.get_current_stats()["tokens_per_hour"] == 7
+
+
+def test_threaded_collector_counts_concurrent_updates():
+    from concurrent.futures import ThreadPoolExecutor
+
+    collector = MetricsCollector(threaded=True)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda index: _record(collector, f"req-{index}"), range(400)))
+
+    stats = collector.get_current_stats()
+    assert stats["total_requests"] == 400
+    assert stats["active_requests"] == 0
+
+
+def test_completed_requests_are_buffered_until_read_or_batch_full():
+    from app.services import metrics as metrics_module
+
+    collector = MetricsCollector()
+    for index in range(metrics_module.METRICS_FLUSH_BATCH - 1):
+        _record(collector, f"req-{index}")
+    assert len(collector._pending) == metrics_module.METRICS_FLUSH_BATCH - 1
+
+    _record(collector, "req-last")
+    assert not collector._pending
+
+    _record(collector, "req-extra")
+    assert collector.get_current_stats()["total_requests"] == metrics_module.METRICS_FLUSH_BATCH + 1
+    assert not collector._pending
+
+
+def test_snapshot_tag_changes_only_with_data():
+    collector = MetricsCollector()
+    tag = collector.snapshot_tag()
+    assert collector.snapshot_tag() == tag
+    collector.get_current_stats()
+    assert collector.snapshot_tag() == tag
+
+    _record(collector, "req-1")
+    assert collector.snapshot_tag() != tag
+    assert MetricsCollector().snapshot_tag() != collector.snapshot_tag()
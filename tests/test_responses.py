@@ -0,0 +1,27 @@
+import asyncio
+import inspect
+import json
+
+from app.models.api_models import EmbeddingFloatData, EmbeddingResponse, Usage
+from app.utils.responses import EMBEDDING_JSON_CHUNK_SIZE, iter_embedding_json
+
+
+def test_iter_embedding_json_matches_model_dump():
+    count = EMBEDDING_JSON_CHUNK_SIZE + 3
+    response = EmbeddingResponse.model_construct(
+        object="list",
+        data=[EmbeddingFloatData.model_construct(object="embedding", embedding=[0.5, -1.25], index=i) for i in range(count)],
+        model="text-embedding-3-small",
+        usage=Usage.model_construct(prompt_tokens=6, completion_tokens=0, total_tokens=6),
+    )
+
+    async def collect():
+        return [part async for part in iter_embedding_json(response)]
+
+    # 异步生成器：StreamingResponse不会把它放到线程池逐块迭代
+    assert inspect.isasyncgenfunction(iter_embedding_json)
+    parts = asyncio.run(collect())
+
+    # 开头 + 两个嵌入分块 + 结尾
+    assert len(parts) == 4
+    assert json.loads(b"".join(parts)) == response.model_dump()